@@ -1,12 +1,64 @@
 # server.py
 from mcp.server.fastmcp import FastMCP
-import uvicorn
-import requests
-import urllib3
+import asyncio
+import codecs
+import contextlib
+import hashlib
 import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from xml.etree import ElementTree
+
+import httpx
+import uvicorn
+
+# Shared HTTP client settings
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "10"))
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "100"))
+SEARCH_MAX_CONNECTIONS_PER_HOST = int(os.getenv("SEARCH_MAX_CONNECTIONS_PER_HOST", "10"))
+SEARCH_KEEPALIVE_EXPIRY = float(os.getenv("SEARCH_KEEPALIVE_EXPIRY", "30"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "10"))
+SEARCH_MAX_BODY_BYTES = int(os.getenv("SEARCH_MAX_BODY_BYTES", str(2 * 1024 * 1024)))
+
+# meta_search settings
+SEARCH_META_ENGINES = [engine.strip() for engine in os.getenv("SEARCH_META_ENGINES", "google,bing,duckduckgo").split(",") if engine.strip()]
+SEARCH_META_QUORUM = int(os.getenv("SEARCH_META_QUORUM", "2"))
+SEARCH_META_DEADLINE = float(os.getenv("SEARCH_META_DEADLINE", "5"))
+SEARCH_RRF_K = int(os.getenv("SEARCH_RRF_K", "60"))
+
+# Search result cache settings; SEARCH_CACHE_TTL_<ENGINE> (e.g. SEARCH_CACHE_TTL_BING) overrides the TTL per engine
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_STALE = float(os.getenv("SEARCH_CACHE_STALE", "600"))
+SEARCH_CACHE_ERROR_TTL = float(os.getenv("SEARCH_CACHE_ERROR_TTL", "30"))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "")
+
+# Per-engine protection settings; each can be overridden per engine with a _<ENGINE> suffix (e.g. SEARCH_RATE_LIMIT_GOOGLE)
+SEARCH_RATE_LIMIT = float(os.getenv("SEARCH_RATE_LIMIT", "5"))
+SEARCH_RATE_BURST = float(os.getenv("SEARCH_RATE_BURST", "10"))
+SEARCH_BREAKER_FAILURES = int(os.getenv("SEARCH_BREAKER_FAILURES", "5"))
+SEARCH_BREAKER_RESET = float(os.getenv("SEARCH_BREAKER_RESET", "30"))
+SEARCH_RETRIES = int(os.getenv("SEARCH_RETRIES", "2"))
+SEARCH_RETRY_BACKOFF = float(os.getenv("SEARCH_RETRY_BACKOFF", "0.2"))
+SEARCH_RETRY_BUDGET = float(os.getenv("SEARCH_RETRY_BUDGET", "0.1"))
 
-# Disable SSL warnings (optional - you can remove this if you prefer to see warnings)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Default headers to mimic a browser
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
 
 # Create an MCP server
 mcp = FastMCP("Demo",
@@ -18,7 +70,506 @@ timeout=60,
 # Get the ASGI app from the MCP server
 app = mcp.sse_app()
 
-def search_web(base_url: str, query: str, query_param: str = "q", additional_params: dict = None, headers: dict = None, parser_func=None) -> list[str]:
+_http_client: httpx.AsyncClient | None = None
+_host_slots: dict[str, asyncio.Semaphore] = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the long-lived HTTP client shared by every search, creating it on first use.
+    Connections are kept alive between calls, and concurrent calls to the same engine
+    are multiplexed over one connection when the server speaks HTTP/2.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            # Certificate verification is disabled for these searches
+            verify=False,
+            headers=DEFAULT_HEADERS,
+            timeout=SEARCH_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=SEARCH_MAX_CONNECTIONS,
+                max_keepalive_connections=SEARCH_MAX_CONNECTIONS,
+                keepalive_expiry=SEARCH_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _http_client
+
+async def close_http_client():
+    """Close the shared HTTP client and its pooled connections"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Close the shared HTTP client when the server shuts down"""
+    yield
+    await close_http_client()
+
+app.router.lifespan_context = lifespan
+
+def host_slot(url: str) -> asyncio.Semaphore:
+    """Per-host semaphore capping concurrent requests to one engine at SEARCH_MAX_CONNECTIONS_PER_HOST"""
+    host = urlsplit(url).netloc
+    if host not in _host_slots:
+        _host_slots[host] = asyncio.Semaphore(SEARCH_MAX_CONNECTIONS_PER_HOST)
+    return _host_slots[host]
+
+class SearchError(Exception):
+    """A search engine answered, but not with results"""
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class EngineUnavailable(SearchError):
+    """The request wasn't sent: the engine's circuit is open or its rate limit is exhausted"""
+
+class SearchCache:
+    """
+    LRU cache of search results with optional SQLite persistence.
+
+    Entries are fresh for their TTL and are then served stale for SEARCH_CACHE_STALE
+    more seconds while a background task refreshes them. Failures are cached
+    (in memory only) for SEARCH_CACHE_ERROR_TTL seconds so a failing engine isn't
+    hammered by repeats of the same query.
+    """
+
+    def __init__(self, max_entries: int, path: str = ""):
+        self.max_entries = max_entries
+        # key -> (value, error, fresh_until, stale_until), times from time.time() so they survive restarts
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._refreshing: dict[str, asyncio.Task] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0, "evictions": 0}
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT, fresh_until REAL, stale_until REAL)")
+            self._db.execute("DELETE FROM search_cache WHERE stale_until < ?", (time.time(),))
+            self._db.commit()
+
+    async def get_or_fetch(self, key: str, ttl: float, fetch):
+        """Return the cached value for key, calling fetch() (a coroutine function) on a miss"""
+        if ttl <= 0:
+            return await fetch()
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._load, key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is not None:
+            value, error, fresh_until, stale_until = entry
+            if now < fresh_until:
+                self._entries.move_to_end(key)
+                if error is not None:
+                    self.stats["negative_hits"] += 1
+                    raise error
+                self.stats["hits"] += 1
+                return value
+            if error is None and now < stale_until:
+                self._entries.move_to_end(key)
+                self.stats["stale_hits"] += 1
+                if key not in self._refreshing:
+                    self._refreshing[key] = asyncio.create_task(self._refresh(key, ttl, fetch))
+                return value
+        self.stats["misses"] += 1
+        return await self._fetch_and_store(key, ttl, fetch)
+
+    async def _fetch_and_store(self, key: str, ttl: float, fetch):
+        try:
+            value = await fetch()
+        except (SearchError, httpx.HTTPError) as e:
+            if isinstance(e, EngineUnavailable):
+                # Nothing was learned about the query itself
+                raise
+            now = time.time()
+            self._remember(key, (None, e, now + SEARCH_CACHE_ERROR_TTL, now + SEARCH_CACHE_ERROR_TTL))
+            raise
+        now = time.time()
+        entry = (value, None, now + ttl, now + ttl + SEARCH_CACHE_STALE)
+        self._remember(key, entry)
+        if self._db is not None:
+            await asyncio.to_thread(self._save, key, entry)
+        return value
+
+    async def _refresh(self, key: str, ttl: float, fetch):
+        """Revalidate a stale entry; on failure the stale value stays until it expires"""
+        try:
+            self.stats["refreshes"] += 1
+            value = await fetch()
+            now = time.time()
+            entry = (value, None, now + ttl, now + ttl + SEARCH_CACHE_STALE)
+            self._remember(key, entry)
+            if self._db is not None:
+                await asyncio.to_thread(self._save, key, entry)
+        except Exception:
+            self.stats["refresh_errors"] += 1
+        finally:
+            self._refreshing.pop(key, None)
+
+    def _remember(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _load(self, key: str) -> tuple | None:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, fresh_until, stale_until FROM search_cache WHERE key = ? AND stale_until > ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]), None, row[1], row[2])
+
+    def _save(self, key: str, entry: tuple):
+        value, _, fresh_until, stale_until = entry
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, fresh_until, stale_until) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), fresh_until, stale_until),
+            )
+            self._db.commit()
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["negative_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_ratio": round((lookups - self.stats["misses"]) / lookups, 4) if lookups else 0.0,
+            "persistent": self._db is not None,
+        }
+
+search_cache = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_PATH)
+
+def cache_key(base_url: str, query: str, query_param: str = "q", additional_params: dict = None, parser_func=None, max_results: int = None) -> str:
+    """Cache key for a search: engine URL, case- and whitespace-normalized query, and request parameters"""
+    normalized_query = " ".join(query.lower().split())
+    parts = [base_url, query_param, normalized_query, sorted((additional_params or {}).items()), getattr(parser_func, "__name__", None), max_results]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+def engine_setting(base_url: str, name: str, default: float) -> float:
+    """Setting for the engine at base_url: the <name>_<ENGINE> environment variable if set, else default"""
+    for engine, settings in SEARCH_ENGINES.items():
+        if settings["base_url"] == base_url:
+            return float(os.getenv(f"{name}_{engine.upper()}", default))
+    return default
+
+def cache_ttl_for(base_url: str) -> float:
+    """Cache TTL for the engine at base_url: SEARCH_CACHE_TTL_<ENGINE> if set, else SEARCH_CACHE_TTL"""
+    return engine_setting(base_url, "SEARCH_CACHE_TTL", SEARCH_CACHE_TTL)
+
+class EngineGuard:
+    """
+    Protects one engine from overload and callers from a failing engine:
+    - a token bucket allows rate requests/second with bursts of up to burst requests;
+      callers queue for a token, or fail at once if the wait would exceed SEARCH_TIMEOUT
+    - a circuit breaker opens after breaker_failures consecutive failures and fails calls
+      fast for breaker_reset seconds, then lets a single probe through
+    - timeouts, connection errors, 429s and 5xx responses are retried up to SEARCH_RETRIES
+      times with full-jitter backoff, as long as the retry budget (retry_budget retries per
+      request, so retries can't multiply load on an engine that's already struggling) allows
+    """
+
+    def __init__(self, base_url: str):
+        self.rate = engine_setting(base_url, "SEARCH_RATE_LIMIT", SEARCH_RATE_LIMIT)
+        self.burst = max(1.0, engine_setting(base_url, "SEARCH_RATE_BURST", SEARCH_RATE_BURST))
+        self.breaker_failures = int(engine_setting(base_url, "SEARCH_BREAKER_FAILURES", SEARCH_BREAKER_FAILURES))
+        self.breaker_reset = engine_setting(base_url, "SEARCH_BREAKER_RESET", SEARCH_BREAKER_RESET)
+        self.retries = int(engine_setting(base_url, "SEARCH_RETRIES", SEARCH_RETRIES))
+        self.retry_ratio = engine_setting(base_url, "SEARCH_RETRY_BUDGET", SEARCH_RETRY_BUDGET)
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        # Start with enough budget for one retry so an idle engine can still retry
+        self.retry_budget = 1.0
+        self.stats = {"requests": 0, "failures": 0, "retries": 0, "rate_limited": 0, "short_circuited": 0, "opened": 0}
+
+    async def _throttle(self):
+        """Wait for a token from the bucket"""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        # Reserve the token now; a negative balance is the queue of callers waiting for one
+        self.tokens -= 1
+        wait = -self.tokens / self.rate
+        if wait > SEARCH_TIMEOUT:
+            self.tokens += 1
+            self.stats["rate_limited"] += 1
+            raise EngineUnavailable("Rate limit exceeded, try again later")
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _before_attempt(self):
+        """Fail fast while the circuit is open; once it has cooled down, allow one probe"""
+        if self.state == "open":
+            remaining = self.opened_at + self.breaker_reset - time.monotonic()
+            if remaining > 0:
+                self.stats["short_circuited"] += 1
+                raise EngineUnavailable(f"Engine unavailable after repeated errors, retry in {remaining:.0f}s")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probing:
+                self.stats["short_circuited"] += 1
+                raise EngineUnavailable("Engine unavailable after repeated errors, recovery check in progress")
+            self.probing = True
+
+    def _record(self, ok: bool):
+        self.probing = False
+        if ok:
+            self.failures = 0
+            self.state = "closed"
+            return
+        self.stats["failures"] += 1
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.breaker_failures):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.stats["opened"] += 1
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        if isinstance(error, httpx.TransportError):
+            return True
+        return isinstance(error, SearchError) and (error.status_code == 429 or (error.status_code or 0) >= 500)
+
+    async def call(self, attempt):
+        """Run attempt() (a coroutine function) under the rate limit, circuit breaker and retry policy"""
+        self.stats["requests"] += 1
+        self.retry_budget = min(10.0, self.retry_budget + self.retry_ratio)
+        for retry in range(self.retries + 1):
+            self._before_attempt()
+            try:
+                await self._throttle()
+                result = await attempt()
+            except asyncio.CancelledError:
+                self.probing = False
+                raise
+            except EngineUnavailable:
+                self.probing = False
+                raise
+            except Exception as e:
+                self._record(False)
+                if retry >= self.retries or not self._retryable(e) or self.retry_budget < 1:
+                    raise
+                self.retry_budget -= 1
+                self.stats["retries"] += 1
+                await asyncio.sleep(random.uniform(0, SEARCH_RETRY_BACKOFF * 2 ** retry))
+            else:
+                self._record(True)
+                return result
+
+    def metrics(self) -> dict:
+        return {**self.stats, "circuit": self.state, "retry_budget": round(self.retry_budget, 2)}
+
+_engine_guards: dict[str, EngineGuard] = {}
+
+def engine_guard(base_url: str) -> EngineGuard:
+    """The EngineGuard for the host at base_url"""
+    host = urlsplit(base_url).netloc
+    if host not in _engine_guards:
+        _engine_guards[host] = EngineGuard(base_url)
+    return _engine_guards[host]
+
+_inflight: dict[str, asyncio.Task] = {}
+coalesce_stats = {"coalesced": 0}
+
+def _forget_inflight(key: str, task: asyncio.Task):
+    _inflight.pop(key, None)
+    # Mark the exception retrieved in case every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+async def coalesce(key: str, fetch):
+    """
+    Single-flight: callers asking for a key that's already being fetched wait for
+    that fetch instead of sending their own request. A cancelled caller doesn't
+    cancel the fetch for the others.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(fetch())
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _forget_inflight(key, done))
+    else:
+        coalesce_stats["coalesced"] += 1
+    return await asyncio.shield(task)
+
+async def iter_body(response: httpx.Response):
+    """Stream the response body, failing once it grows past SEARCH_MAX_BODY_BYTES"""
+    received = 0
+    async for chunk in response.aiter_bytes():
+        received += len(chunk)
+        if received > SEARCH_MAX_BODY_BYTES:
+            raise SearchError(f"Response larger than {SEARCH_MAX_BODY_BYTES} bytes")
+        yield chunk
+
+async def read_body(response: httpx.Response) -> bytes:
+    """The whole response body, up to SEARCH_MAX_BODY_BYTES"""
+    return b"".join([chunk async for chunk in iter_body(response)])
+
+async def read_text(response: httpx.Response, max_results: int) -> str:
+    """Raw response text, for engines without a parser"""
+    return (await read_body(response)).decode(response.encoding or "utf-8", errors="replace")
+
+_JSON_DECODER = json.JSONDecoder()
+
+async def stream_json_array(response: httpx.Response, key: str, limit: int) -> list:
+    """
+    The first limit items of the JSON array under key, decoded item by item as the body
+    streams in; nothing after the last wanted item is downloaded. Raises SearchError if
+    the body has no such array.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    chunks = iter_body(response)
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    buffer = ""
+    in_array = False
+    at_end = False
+    items = []
+    try:
+        while len(items) < limit:
+            if not in_array:
+                match = array_start.search(buffer)
+                if match:
+                    buffer = buffer[match.end():]
+                    in_array = True
+                    continue
+                # Keep enough of the tail to match a key split across chunks
+                buffer = buffer[-(len(key) + 64):]
+            else:
+                stripped = buffer.lstrip(" \t\r\n,")
+                if stripped.startswith("]"):
+                    break
+                if stripped:
+                    try:
+                        item, end = _JSON_DECODER.raw_decode(stripped)
+                    except json.JSONDecodeError:
+                        # Most likely the item isn't complete yet
+                        if at_end:
+                            raise SearchError("Malformed JSON response")
+                    else:
+                        items.append(item)
+                        buffer = stripped[end:]
+                        continue
+            if at_end:
+                if not in_array:
+                    raise SearchError(f"No {key} results array in response")
+                break
+            chunk = await anext(chunks, None)
+            if chunk is None:
+                at_end = True
+                buffer += decoder.decode(b"", final=True)
+            else:
+                buffer += decoder.decode(chunk)
+    finally:
+        await chunks.aclose()
+    return items
+
+def _result(title, url, snippet) -> dict | None:
+    """Compact search result, or None if there's no URL to link to"""
+    if not url or not isinstance(url, str):
+        return None
+    return {"title": (title or "").strip(), "url": url, "snippet": (snippet or "").strip()}
+
+async def parse_google_results(response: httpx.Response, max_results: int) -> list[dict]:
+    """Organic results from Google's brd_json response, streamed"""
+    results = []
+    for item in await stream_json_array(response, "organic", max_results):
+        if isinstance(item, dict):
+            results.append(_result(item.get("title"), item.get("link") or item.get("url"), item.get("description") or item.get("snippet")))
+    return [result for result in results if result]
+
+async def parse_bing_results(response: httpx.Response, max_results: int) -> list[dict]:
+    """Items from Bing's RSS feed, parsed incrementally as the body streams in"""
+    parser = ElementTree.XMLPullParser(events=("end",))
+    results = []
+    chunks = iter_body(response)
+    try:
+        async for chunk in chunks:
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                if element.tag != "item":
+                    continue
+                result = _result(element.findtext("title"), element.findtext("link"), element.findtext("description"))
+                element.clear()
+                if result:
+                    results.append(result)
+                    if len(results) >= max_results:
+                        return results
+    except ElementTree.ParseError as e:
+        raise SearchError(f"Malformed RSS response: {str(e)}")
+    finally:
+        await chunks.aclose()
+    return results
+
+async def parse_duckduckgo_results(response: httpx.Response, max_results: int) -> list[dict]:
+    """
+    Answer, definition, abstract, results and related topics (flattening topic groups)
+    from DuckDuckGo's instant answer API. The response is a single small object, so it's
+    read whole (within SEARCH_MAX_BODY_BYTES) rather than streamed.
+    """
+    try:
+        data = json.loads(await read_body(response))
+    except json.JSONDecodeError as e:
+        raise SearchError(f"Malformed JSON response: {str(e)}")
+    results = []
+    if data.get("Answer"):
+        results.append({"title": "Answer", "url": data.get("AnswerURL") or "", "snippet": str(data["Answer"])})
+    if data.get("Definition"):
+        results.append({"title": "Definition", "url": data.get("DefinitionURL") or "", "snippet": data["Definition"]})
+    results.append(_result(data.get("Heading"), data.get("AbstractURL"), data.get("AbstractText")))
+    topics = list(data.get("Results") or []) + list(data.get("RelatedTopics") or [])
+    for topic in topics:
+        if not isinstance(topic, dict):
+            continue
+        for entry in topic.get("Topics", [topic]):
+            if isinstance(entry, dict):
+                text = entry.get("Text") or ""
+                results.append(_result(text.split(" - ")[0], entry.get("FirstURL"), text))
+    return [result for result in results if result][:max_results]
+
+async def fetch_search(base_url: str, query: str, query_param: str = "q", additional_params: dict = None, headers: dict = None, parser_func=None, max_results: int = SEARCH_MAX_RESULTS):
+    """
+    Send a search request over the shared client, guarded by the engine's EngineGuard, and
+    parse the streamed response with parser_func(response, max_results), or return the raw
+    text if there's no parser. Raises SearchError or httpx errors on failure.
+    """
+    params = {query_param: query}
+    
+    if additional_params:
+        params.update(additional_params)
+
+    async def attempt():
+        async with host_slot(base_url):
+            async with get_http_client().stream("GET", base_url, params=params, headers=headers) as response:
+                if response.status_code != 200:
+                    raise SearchError(f"HTTP {response.status_code} - {response.reason_phrase}", response.status_code)
+                return await (parser_func or read_text)(response, max_results)
+
+    return await engine_guard(base_url).call(attempt)
+
+async def cached_search(base_url: str, query: str, query_param: str = "q", additional_params: dict = None, headers: dict = None, parser_func=None, max_results: int = SEARCH_MAX_RESULTS):
+    """fetch_search through the search cache, with identical concurrent searches coalesced into one request"""
+    key = cache_key(base_url, query, query_param, additional_params, parser_func, max_results)
+    return await search_cache.get_or_fetch(
+        key,
+        cache_ttl_for(base_url),
+        lambda: coalesce(key, lambda: fetch_search(base_url, query, query_param, additional_params, headers, parser_func, max_results)),
+    )
+
+async def search_web(base_url: str, query: str, query_param: str = "q", additional_params: dict = None, headers: dict = None, parser_func=None, max_results: int = SEARCH_MAX_RESULTS) -> list:
     """
     Generic web search function
     
@@ -27,168 +578,193 @@ def search_web(base_url: str, query: str, query_param: str = "q", additional_par
         query: Search query string
         query_param: Query parameter name (default: "q")
         additional_params: Additional URL parameters
-        headers: HTTP headers to send with request
-        parser_func: Custom function to parse the response
+        headers: HTTP headers to send with request, on top of DEFAULT_HEADERS
+        parser_func: Async function parsing the streamed response into at most max_results results
+        max_results: Number of results to extract
     
     Returns:
-        List of search result titles or error message
+        List of search results or error message
     """
     try:
-        formatted_query = "+".join(query.split(" "))
-        params = {query_param: formatted_query}
-        
-        if additional_params:
-            params.update(additional_params)
-        
-        # Build URL with parameters
-        param_string = "&".join([f"{k}={v}" for k, v in params.items()])
-        url = f"{base_url}?{param_string}"
-        
-        # Default headers to mimic a browser
-        default_headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        if headers:
-            default_headers.update(headers)
-        
-        response = requests.get(url, verify=False, headers=default_headers, timeout=10)
-        
-        if response.status_code == 200:
-            # Use custom parser if provided
-            if parser_func:
-                return parser_func(response, query)
-            
-            # Try to parse as JSON and look for organic results
-            try:
-                data = response.text
-                return data
-                # json_data = response.json()
-                
-                # # # Check for organic results first
-                # # if 'organic' in json_data and json_data['organic']:
-                # #     organic_results = json_data['organic']
-                # #     results = []
-                    
-                # #     for result in organic_results[:10]:  # Limit to first 10 results
-                # #         if isinstance(result, dict):
-                # #             # Try different common fields for title
-                # #             title = result.get('title') or result.get('name') or result.get('snippet', 'No title')
-                # #             results.append(title)
-                    
-                # #     if results:
-                # #         return results
-                # #     else:
-                # #         return [f"Search completed for '{query}' - organic results found but no titles extracted"]
-                
-                # # # Fallback to other result structures
-                # # elif 'results' in json_data and json_data['results']:
-                # #     results = json_data['results']
-                # #     return [result.get("title", "No title") for result in results[:10] if isinstance(result, dict)]
-                
-                # # else:
-                # #     return [f"Search completed for '{query}' - no organic or results array found in response"]
-                # return json_data
-                    
-            except json.JSONDecodeError:
-                # If JSON parsing fails, return basic info about the response
-                content_length = len(response.text)
-                return [f"Search completed for '{query}' - received {content_length} characters of non-JSON content"]
-            except KeyError as e:
-                return [f"Search completed for '{query}' - missing expected key: {str(e)}"]
-            except Exception as e:
-                return [f"Search completed for '{query}' - error parsing response: {str(e)}"]
-        else:
-            return [f"Error: HTTP {response.status_code} - {response.reason}"]
-            
-    except requests.exceptions.Timeout:
+        return await cached_search(base_url, query, query_param, additional_params, headers, parser_func, max_results)
+    except SearchError as e:
+        return [f"Error: {str(e)}"]
+    except httpx.TimeoutException:
         return [f"Error: Request timeout for query '{query}'"]
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return [f"Error: Request failed - {str(e)}"]
     except Exception as e:
         return [f"Error: {str(e)}"]
 
-def parse_duckduckgo_response(response, query):
-    """Parse DuckDuckGo API response"""
-    try:
-        data = response.json()
-        results = []
-        
-        # Check for organic results first
-        if 'organic' in data and data['organic']:
-            for result in data['organic'][:5]:
-                if isinstance(result, dict):
-                    title = result.get('title') or result.get('snippet', 'No title')
-                    results.append(title)
-        
-        # DuckDuckGo has different result types as fallback
-        if not results:
-            if "RelatedTopics" in data and data["RelatedTopics"]:
-                for topic in data["RelatedTopics"][:5]:  # Limit to first 5
-                    if isinstance(topic, dict) and "Text" in topic:
-                        results.append(topic["Text"][:100] + "..." if len(topic["Text"]) > 100 else topic["Text"])
-            
-            if "Answer" in data and data["Answer"]:
-                results.insert(0, f"Answer: {data['Answer']}")
-            
-            if "Definition" in data and data["Definition"]:
-                results.insert(0, f"Definition: {data['Definition']}")
-        
-        if not results:
-            return [f"Search completed for '{query}' - no specific results found"]
-        
-        return results
-        
-    except Exception as e:
-        return [f"Error parsing DuckDuckGo response: {str(e)}"]
+# Request settings for each engine, shared by the single-engine tools and meta_search
+SEARCH_ENGINES = {
+    "google": {
+        "base_url": "https://www.google.com/search",
+        "additional_params": {"brd_json": "1", "num": "50"},
+        "parser_func": parse_google_results,
+    },
+    "bing": {
+        "base_url": "https://www.bing.com/search",
+        "additional_params": {"format": "rss", "count": "10"},
+        "headers": {'Accept': 'application/rss+xml, application/xml, text/xml'},
+        "parser_func": parse_bing_results,
+    },
+    "duckduckgo": {
+        "base_url": "https://api.duckduckgo.com/",
+        "query_param": "q",
+        "additional_params": {"format": "json", "no_redirect": "1", "no_html": "1", "skip_disambig": "1"},
+        "parser_func": parse_duckduckgo_results,
+    },
+}
 
 # Add a Google search tool
 @mcp.tool()
-def google(query: str) -> list[str]:
+async def google(query: str, max_results: int = SEARCH_MAX_RESULTS) -> list:
     """
-    Search Google for a query and return results
+    Search Google for a query and return results (title, url, snippet)
     """
-    return search_web(
-        base_url="https://www.google.com/search",
-        query=query,
-        additional_params={"brd_json": "1", "num": "50"}
-    )
+    return await search_web(query=query, max_results=max_results, **SEARCH_ENGINES["google"])
 
 # Add a Bing search tool
 @mcp.tool()
-def bing(query: str) -> list[str]:
+async def bing(query: str, max_results: int = SEARCH_MAX_RESULTS) -> list:
     """
-    Search Bing for a query and return results
+    Search Bing for a query and return results (title, url, snippet)
     """
-    return search_web(
-        base_url="https://www.bing.com/search",
-        query=query,
-        additional_params={"format": "rss", "count": "10"},
-        headers={'Accept': 'application/rss+xml, application/xml, text/xml'}
-    )
+    return await search_web(query=query, max_results=max_results, **SEARCH_ENGINES["bing"])
 
 # Add a DuckDuckGo search tool (alternative that might work better)
 @mcp.tool()
-def duckduckgo(query: str) -> list[str]:
+async def duckduckgo(query: str, max_results: int = SEARCH_MAX_RESULTS) -> list:
     """
-    Search DuckDuckGo for a query and return results
+    Search DuckDuckGo for a query and return results (title, url, snippet)
     """
-    return search_web(
-        base_url="https://api.duckduckgo.com/",
-        query=query,
-        query_param="q",
-        additional_params={"format": "json", "no_redirect": "1", "no_html": "1", "skip_disambig": "1"},
-        parser_func=parse_duckduckgo_response
-    )
+    return await search_web(query=query, max_results=max_results, **SEARCH_ENGINES["duckduckgo"])
+
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|gclid|fbclid|msclkid|ref|ref_src)$", re.IGNORECASE)
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a URL for deduplication: lower-case scheme and host without "www." or
+    default ports, no fragment, tracking parameters or trailing slash, and sorted query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower().removeprefix("www.")
+    if parts.port and not (scheme, parts.port) in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _TRACKING_PARAMS.match(key)
+    ))
+    # http and https copies of a page are the same result
+    return urlunsplit(("https" if scheme == "http" else scheme, host, parts.path.rstrip("/"), query, ""))
+
+def fuse_results(ranked: dict[str, list[dict]], limit: int) -> list[dict]:
+    """
+    Merge per-engine result lists with reciprocal rank fusion: each result scores
+    1 / (SEARCH_RRF_K + rank) for every engine that returned it, and duplicates
+    (by normalized URL) are merged, keeping the first title and longest snippet seen.
+    """
+    merged: dict[str, dict] = {}
+    for engine, results in ranked.items():
+        seen = set()
+        for rank, result in enumerate(results, start=1):
+            # Instant answers without a URL can't be matched across engines
+            if not result["url"]:
+                continue
+            key = normalize_url(result["url"])
+            if key in seen:
+                continue
+            seen.add(key)
+            entry = merged.setdefault(key, {**result, "engines": [], "score": 0.0})
+            entry["engines"].append(engine)
+            entry["score"] += 1 / (SEARCH_RRF_K + rank)
+            if not entry["title"]:
+                entry["title"] = result["title"]
+            if len(result["snippet"]) > len(entry["snippet"]):
+                entry["snippet"] = result["snippet"]
+    fused = sorted(merged.values(), key=lambda entry: entry["score"], reverse=True)[:limit]
+    for entry in fused:
+        entry["score"] = round(entry["score"], 5)
+    return fused
+
+async def _engine_results(engine: str, query: str, max_results: int) -> list[dict]:
+    """Structured results from one engine, shared with the single-engine tools' cache; raises on failure"""
+    return await cached_search(query=query, max_results=max_results, **SEARCH_ENGINES[engine])
+
+@mcp.tool()
+async def meta_search(query: str, engines: list[str] | None = None, max_results: int = 10, quorum: int | None = None, deadline: float | None = None) -> dict:
+    """
+    Search several engines at once and return one merged, deduplicated result list.
+    Returns as soon as `quorum` engines have answered or `deadline` seconds have passed,
+    so a slow engine only costs its results, not the wait.
+    
+    Args:
+        query: Search query string
+        engines: Engines to query (default: all configured engines)
+        max_results: Number of merged results to return
+        quorum: Number of successful engines to wait for (default: SEARCH_META_QUORUM)
+        deadline: Seconds to wait at most (default: SEARCH_META_DEADLINE)
+    """
+    engines = engines or SEARCH_META_ENGINES
+    unknown = [engine for engine in engines if engine not in SEARCH_ENGINES]
+    if unknown:
+        return {"error": f"Unknown engines: {', '.join(unknown)}", "available": list(SEARCH_ENGINES)}
+    quorum = min(quorum or SEARCH_META_QUORUM, len(engines))
+    deadline = deadline if deadline and deadline > 0 else SEARCH_META_DEADLINE
+
+    started = time.monotonic()
+    tasks = {asyncio.create_task(_engine_results(engine, query, max(1, max_results))): engine for engine in engines}
+    status = {engine: "pending" for engine in engines}
+    ranked = {}
+    pending = set(tasks)
+    try:
+        while pending and len(ranked) < quorum:
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                engine = tasks[task]
+                try:
+                    ranked[engine] = task.result()
+                    status[engine] = f"ok ({len(ranked[engine])} results)"
+                except httpx.TimeoutException:
+                    status[engine] = "error: request timeout"
+                except Exception as e:
+                    status[engine] = f"error: {str(e) or type(e).__name__}"
+    finally:
+        # Engines still running when the quorum or deadline is reached are dropped
+        for task in pending:
+            task.cancel()
+            status[tasks[task]] = "skipped (quorum reached)" if len(ranked) >= quorum else "timeout"
+
+    return {
+        "query": query,
+        "results": fuse_results(ranked, max(1, max_results)),
+        "engines": status,
+        "elapsed_ms": round((time.monotonic() - started) * 1000),
+    }
 
 # Add a simple web search that just confirms the search was made
 @mcp.tool()
-def web_search_simple(query: str) -> list[str]:
+async def web_search_simple(query: str) -> list[str]:
     """
     Simple web search that returns a formatted response
     """
     return [f"Web search performed for: '{query}'. This is a mock search result demonstrating the search functionality."]
 
+# Expose search metrics
+@mcp.resource("metrics://search")
+def search_metrics() -> str:
+    """Search cache hit ratios, request coalescing and per-engine rate limit/circuit breaker counters"""
+    return json.dumps({
+        "cache": search_cache.metrics(),
+        "coalesced": coalesce_stats["coalesced"],
+        "engines": {host: guard.metrics() for host, guard in _engine_guards.items()},
+    })
+
 # Add a dynamic greeting resource
 @mcp.resource("greeting://{name}")
 def get_greeting(name: str) -> str:
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark for result conversion and rendering in mssql.py.
+
+Compares the original per-value conversion loop and nested list comprehension
+markdown rendering with RowConverter/RowFormatter on synthetic rows shaped like
+pyodbc results. No SQL Server connection is needed.
+
+    python benchmark.py [rows]
+"""
+import sys
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from mssql import RowConverter, RowFormatter
+
+DESCRIPTION = [
+    ("id", int, None, 10, 10, 0, False),
+    ("name", str, None, 50, 50, 0, True),
+    ("price", Decimal, None, 12, 12, 2, True),
+    ("ratio", float, None, 53, 53, 0, True),
+    ("created_at", datetime, None, 23, 23, 3, True),
+    ("birthday", date, None, 10, 10, 0, True),
+    ("payload", bytearray, None, 16, 16, 0, True),
+]
+
+def make_rows(count: int) -> list:
+    created = datetime(2024, 1, 1, 12, 30)
+    return [
+        (i, f"customer {i}", Decimal("19.99"), i / 7, created, date(1990, 1, 1), bytearray(16))
+        for i in range(count)
+    ]
+
+def legacy_convert(columns, rows):
+    """The original execute_sql_query conversion loop"""
+    results = []
+    for row in rows:
+        row_dict = {}
+        for i, value in enumerate(row):
+            if isinstance(value, datetime):
+                row_dict[columns[i]] = value.isoformat()
+            elif isinstance(value, (bytes, bytearray)):
+                row_dict[columns[i]] = f"BINARY DATA ({len(value)} bytes)"
+            else:
+                row_dict[columns[i]] = value
+        results.append(row_dict)
+    return results
+
+def legacy_markdown(results):
+    """The original mcp_endpoint markdown rendering"""
+    columns = results[0].keys()
+    table_header = " | ".join(columns)
+    separator = " | ".join(["---" for _ in columns])
+    table_rows = [" | ".join([str(row.get(col, "")) for col in columns]) for row in results]
+    content = f"| {table_header} |\n| {separator} |\n"
+    return content + "\n".join([f"| {row} |" for row in table_rows])
+
+def timed(label: str, count: int, func, *args, repeat: int = 3):
+    """Run func repeat times and report the best rows/sec"""
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"{label:<28} {elapsed:8.3f}s {count / elapsed:>14,.0f} rows/s")
+    return result
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = make_rows(count)
+    columns = [column[0] for column in DESCRIPTION]
+    print(f"{count:,} synthetic rows, {len(columns)} columns\n")
+
+    results = timed("legacy convert", count, legacy_convert, columns, rows)
+    timed("legacy markdown", count, legacy_markdown, results)
+
+    converter = RowConverter(DESCRIPTION)
+    results = timed("RowConverter.convert", count, converter.convert, rows)
+    for output_format in ("markdown", "csv", "ndjson"):
+        formatter = RowFormatter(columns, output_format)
+        timed(f"RowFormatter ({output_format})", count, formatter.rows, results)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,38 @@
 import asyncio
+import base64
+import codecs
+import contextlib
+import csv
+import decimal
+import hashlib
+import io
 import json
 import logging
 import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple, Any
+from datetime import date, datetime, time as dt_time
+from typing import Any, AsyncIterator, Callable, Deque, Dict, FrozenSet, Hashable, Iterable, Iterator, List, Optional, Tuple
 
 import pyodbc
 from starlette.applications import Starlette
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, StreamingResponse
 from starlette.routing import Route
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow and Parquet output are optional
+    pa = None
+    pq = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,6 +44,38 @@ SQL_USERNAME = os.environ.get("SQL_USERNAME", "sa")
 SQL_PASSWORD = os.environ.get("SQL_PASSWORD", "your_password")
 SQL_DRIVER = os.environ.get("SQL_DRIVER", "{ODBC Driver 17 for SQL Server}")
 
+# Connection pool parameters
+SQL_POOL_MIN_SIZE = int(os.environ.get("SQL_POOL_MIN_SIZE", "1"))
+SQL_POOL_MAX_SIZE = int(os.environ.get("SQL_POOL_MAX_SIZE", "10"))
+SQL_POOL_IDLE_TIMEOUT = float(os.environ.get("SQL_POOL_IDLE_TIMEOUT", "300"))
+SQL_POOL_ACQUIRE_TIMEOUT = float(os.environ.get("SQL_POOL_ACQUIRE_TIMEOUT", "30"))
+# Connections idle for less than this many seconds skip the health check on borrow
+SQL_POOL_HEALTH_CHECK_IDLE = float(os.environ.get("SQL_POOL_HEALTH_CHECK_IDLE", "0"))
+
+# Default and maximum per-request query timeout in seconds
+SQL_QUERY_TIMEOUT = float(os.environ.get("SQL_QUERY_TIMEOUT", "60"))
+
+# Rows fetched per round trip when streaming results
+SQL_STREAM_BATCH_SIZE = int(os.environ.get("SQL_STREAM_BATCH_SIZE", "500"))
+
+# Rows returned per request when the client doesn't ask for a page size, and the hard ceiling on it
+SQL_DEFAULT_ROWS = int(os.environ.get("SQL_DEFAULT_ROWS", "100"))
+SQL_MAX_ROWS = int(os.environ.get("SQL_MAX_ROWS", "1000"))
+
+# Result cache for read-only queries; a TTL of 0 disables caching
+SQL_CACHE_TTL = float(os.environ.get("SQL_CACHE_TTL", "60"))
+SQL_CACHE_MAX_BYTES = int(os.environ.get("SQL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Prepared statements kept per pooled connection for parameterized queries
+SQL_PREPARED_CACHE_SIZE = int(os.environ.get("SQL_PREPARED_CACHE_SIZE", "32"))
+
+# Rows per executemany call for the bulk load endpoint
+SQL_BULK_BATCH_SIZE = int(os.environ.get("SQL_BULK_BATCH_SIZE", "5000"))
+
+# We manage our own pool, so turn off the ODBC driver manager's pooling.
+# This must be set before the first connection is opened.
+pyodbc.pooling = False
+
 # MCP request schema
 @dataclass
 class MCPRequest:
@@ -32,6 +85,17 @@ class MCPRequest:
     temperature: Optional[float] = None
     top_p: Optional[float] = None
     model: Optional[str] = None
+    timeout: Optional[float] = None
+    stream: bool = False
+    stream_format: str = "sse"
+    batch_size: Optional[int] = None
+    max_rows: Optional[int] = None
+    offset: Optional[int] = None
+    cursor: Optional[str] = None
+    cache_ttl: Optional[float] = None
+    format: str = "markdown"
+    query: Optional[str] = None
+    params: Optional[List[Any]] = None
 
 async def parse_mcp_request(request: Request) -> MCPRequest:
     data = await request.json()
@@ -42,6 +106,17 @@ async def parse_mcp_request(request: Request) -> MCPRequest:
         temperature=data.get("temperature"),
         top_p=data.get("top_p"),
         model=data.get("model"),
+        timeout=data.get("timeout"),
+        stream=bool(data.get("stream", False)),
+        stream_format=data.get("stream_format", "sse"),
+        batch_size=data.get("batch_size"),
+        max_rows=data.get("max_rows"),
+        offset=data.get("offset"),
+        cursor=data.get("cursor"),
+        cache_ttl=data.get("cache_ttl"),
+        format=data.get("format", "markdown"),
+        query=data.get("query"),
+        params=data.get("params"),
     )
 
 def get_sql_connection():
@@ -61,139 +136,1340 @@ def get_sql_connection():
         logger.error(f"Error connecting to SQL Server: {e}")
         raise
 
-def execute_sql_query(query: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
-    """Execute a SQL query and return the results as a list of dictionaries"""
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of SQL Server connections.
+    Idle connections are reused most-recently-used first, checked before they are
+    handed out and reset before they go back into the pool.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300.0,
+        acquire_timeout: float = 30.0,
+        health_check_idle: float = 0.0,
+        reset_sql: Optional[str] = None,
+        statement_cache_size: int = 32,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.health_check_idle = health_check_idle
+        self.statement_cache_size = statement_cache_size
+        self._factory = factory
+        self._reset_sql = reset_sql
+        # id(connection) -> {sql: cursor that last prepared it}, least recently used first
+        self._statements: Dict[int, "OrderedDict[str, Any]"] = {}
+
+        self._cond = threading.Condition()
+        self._idle: Deque[Tuple[Any, float]] = deque()  # (connection, returned_at)
+        self._in_use = 0
+        self._closed = False
+
+        # Counters exposed through stats()
+        self._acquired = 0
+        self._created = 0
+        self._discarded = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._prepared_hits = 0
+        self._prepared_misses = 0
+
+    def _open(self) -> Any:
+        conn = self._factory()
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _discard(self, conn: Any) -> None:
+        with self._cond:
+            self._discarded += 1
+            statements = self._statements.pop(id(conn), None)
+        for cursor in (statements or {}).values():
+            self._close_cursor(cursor)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _close_cursor(cursor: Any) -> None:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+    def prepared_cursor(self, conn: Any, sql: str) -> Any:
+        """
+        Return the cursor that last executed sql on this connection, or a new one. pyodbc skips
+        SQLPrepare when a cursor re-executes the same string object it already prepared, so
+        callers should pass sys.intern(sql) here and to execute. Hand the cursor back with
+        return_prepared_cursor.
+        """
+        with self._cond:
+            statements = self._statements.get(id(conn))
+            cursor = statements.pop(sql, None) if statements else None
+            if cursor is not None:
+                self._prepared_hits += 1
+                return cursor
+            self._prepared_misses += 1
+        return conn.cursor()
+
+    def return_prepared_cursor(self, conn: Any, sql: str, cursor: Any) -> None:
+        """Keep a cursor with no pending results for reuse, evicting the least recently used one."""
+        evicted = []
+        with self._cond:
+            statements = self._statements.setdefault(id(conn), OrderedDict())
+            statements[sql] = cursor
+            while len(statements) > self.statement_cache_size:
+                evicted.append(statements.popitem(last=False)[1])
+        for stale in evicted:
+            self._close_cursor(stale)
+
+    def _expire_idle(self) -> List[Any]:
+        """Remove idle connections past the idle timeout, keeping min_size. Caller holds the lock."""
+        expired = []
+        cutoff = time.monotonic() - self.idle_timeout
+        while (
+            self._idle
+            and self._idle[0][1] < cutoff
+            and len(self._idle) + self._in_use > self.min_size
+        ):
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def _is_healthy(self, conn: Any) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1").fetchone()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding unhealthy pooled connection: {e}")
+            return False
+
+    def _reset(self, conn: Any) -> None:
+        """Undo any session state the last borrower may have left behind."""
+        if self._reset_sql:
+            cursor = conn.cursor()
+            cursor.execute(self._reset_sql)
+            cursor.close()
+        if not conn.autocommit:
+            conn.rollback()
+        conn.autocommit = False
+
+    def fill(self) -> None:
+        """Open connections until the pool holds at least min_size of them."""
+        while True:
+            with self._cond:
+                if self._closed or len(self._idle) + self._in_use >= self.min_size:
+                    return
+                self._in_use += 1  # reserve the slot while connecting
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._in_use -= 1
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def acquire(self) -> Any:
+        """Borrow a connection, waiting up to acquire_timeout if the pool is exhausted."""
+        start = time.monotonic()
+        deadline = start + self.acquire_timeout
+        waited = False
+        conn = None
+        returned_at = 0.0
+        expired: List[Any] = []
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                expired.extend(self._expire_idle())
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if len(self._idle) + self._in_use < self.max_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"Timed out after {self.acquire_timeout}s waiting for a SQL Server connection"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._acquired += 1
+            if waited:
+                wait_time = time.monotonic() - start
+                self._waits += 1
+                self._wait_time_total += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+
+        for stale in expired:
+            self._discard(stale)
+
+        try:
+            if conn is not None and time.monotonic() - returned_at >= self.health_check_idle:
+                if not self._is_healthy(conn):
+                    self._discard(conn)
+                    conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn: Any, discard: bool = False) -> None:
+        """Return a borrowed connection, resetting its session state first."""
+        if not discard:
+            try:
+                self._reset(conn)
+            except Exception as e:
+                logger.warning(f"Failed to reset pooled connection, discarding it: {e}")
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                to_close = [conn]
+            else:
+                self._idle.append((conn, time.monotonic()))
+                to_close = []
+            to_close.extend(self._expire_idle())
+            self._cond.notify()
+
+        for stale in to_close:
+            self._discard(stale)
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Context manager that borrows a connection and always returns it."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """Close idle connections; connections still in use are closed when released."""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool usage and wait-time counters."""
+        with self._cond:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "total": self._in_use + len(self._idle),
+                "acquired": self._acquired,
+                "created": self._created,
+                "discarded": self._discarded,
+                "waits": self._waits,
+                "wait_time_total": round(self._wait_time_total, 6),
+                "wait_time_avg": round(self._wait_time_total / self._waits, 6) if self._waits else 0.0,
+                "wait_time_max": round(self._wait_time_max, 6),
+                "prepared_statements": sum(len(statements) for statements in self._statements.values()),
+                "prepared_hits": self._prepared_hits,
+                "prepared_misses": self._prepared_misses,
+            }
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_connection_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            database = SQL_DATABASE.replace("]", "]]")
+            reset_sql = (
+                "IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION; "
+                "SET TRANSACTION ISOLATION LEVEL READ COMMITTED; "
+                "SET XACT_ABORT OFF; "
+                "SET LOCK_TIMEOUT -1; "
+                "SET NOCOUNT OFF; "
+                f"USE [{database}];"
+            )
+            _pool = ConnectionPool(
+                get_sql_connection,
+                min_size=SQL_POOL_MIN_SIZE,
+                max_size=SQL_POOL_MAX_SIZE,
+                idle_timeout=SQL_POOL_IDLE_TIMEOUT,
+                acquire_timeout=SQL_POOL_ACQUIRE_TIMEOUT,
+                health_check_idle=SQL_POOL_HEALTH_CHECK_IDLE,
+                reset_sql=reset_sql,
+                statement_cache_size=SQL_PREPARED_CACHE_SIZE,
+            )
+        return _pool
+
+class QueryResultCache:
+    """
+    In-process LRU cache of query results, bounded by the approximate serialized size of
+    the cached rows. Each entry remembers the tables it read so writes can invalidate it.
+    """
+
+    def __init__(self, max_bytes: int, default_ttl: float):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        # key -> (value, size, expires_at, tables)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, float, FrozenSet[str]]]" = OrderedDict()
+        self._bytes = 0
+        # Bumped on every invalidation so results read before a write aren't cached after it
+        self.generation = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry[2] <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, tables: Iterable[str], generation: int, ttl: Optional[float] = None) -> None:
+        """Cache value unless it is too large or a write has invalidated entries since generation."""
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + ttl, frozenset(tables))
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate_tables(self, tables: Iterable[str]) -> None:
+        """Drop entries that read any of the given tables; with no tables, drop everything."""
+        tables = frozenset(tables)
+        with self._lock:
+            self.generation += 1
+            if tables:
+                stale = [key for key, entry in self._entries.items() if entry[3] & tables]
+            else:
+                stale = list(self._entries)
+            for key in stale:
+                self._remove(key)
+            self._invalidations += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "default_ttl": self.default_ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+_result_cache = QueryResultCache(SQL_CACHE_MAX_BYTES, SQL_CACHE_TTL)
+
+def get_result_cache() -> QueryResultCache:
+    """Return the process-wide query result cache"""
+    return _result_cache
+
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\[(?:[^\]]|\]\])*\]|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\s+", re.DOTALL)
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace and drop comments outside literals so trivially different texts share a cache key"""
+    def replace(match):
+        token = match.group(0)
+        if token[0] in "'[\"":
+            return token
+        return " "
+    return _TOKEN.sub(replace, query).strip().rstrip(";").strip()
+
+_TABLE_REFERENCE = re.compile(
+    r"\b(?:DELETE(?:\s+FROM)?|MERGE(?:\s+INTO)?|FROM|JOIN|INTO|UPDATE|TABLE)\s+((?:(?:\[[^\]]+\]|\"[^\"]+\"|[\w#@$]+)\s*\.\s*)*(?:\[[^\]]+\]|\"[^\"]+\"|[\w#@$]+))",
+    re.IGNORECASE,
+)
+_WRITE_KEYWORDS = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|INTO|EXEC|EXECUTE|CREATE|ALTER|DROP|TRUNCATE|GRANT|REVOKE|DENY|BULK|SET)\b",
+    re.IGNORECASE,
+)
+_NONDETERMINISTIC = re.compile(
+    r"\b(GETDATE|GETUTCDATE|SYSDATETIME|SYSUTCDATETIME|SYSDATETIMEOFFSET|CURRENT_TIMESTAMP|NEWID|NEWSEQUENTIALID|RAND|CRYPT_GEN_RANDOM)\b",
+    re.IGNORECASE,
+)
+_SQL_KEYWORDS = {"select", "set", "where", "values", "output", "with", "from", "top"}
+
+def referenced_tables(query: str) -> FrozenSet[str]:
+    """Lower-cased, unqualified names of the tables a statement reads or writes"""
+    masked = _QUOTED_OR_NESTED.sub(lambda m: m.group(0) if m.group(0)[0] in "[\"" else " " * len(m.group(0)), query)
+    tables = set()
+    for match in _TABLE_REFERENCE.finditer(masked):
+        name = re.split(r"\s*\.\s*", match.group(1))[-1].strip("[]\"").lower()
+        if name not in _SQL_KEYWORDS:
+            tables.add(name)
+    return frozenset(tables)
+
+_STATEMENT_TYPES = {
+    "SELECT": "select",
+    "WITH": "select",
+    "INSERT": "insert",
+    "INTO": "insert",
+    "BULK": "insert",
+    "UPDATE": "update",
+    "DELETE": "delete",
+    "TRUNCATE": "delete",
+    "MERGE": "merge",
+    "CREATE": "ddl",
+    "ALTER": "ddl",
+    "DROP": "ddl",
+    "EXEC": "exec",
+    "EXECUTE": "exec",
+}
+
+def classify_statement(query: str) -> str:
+    """
+    Classify a batch as "select", "insert", "update", "delete", "merge", "ddl", "exec" or "other".
+    A batch that starts with SELECT or WITH but writes (SELECT ... INTO, a CTE feeding an UPDATE)
+    is classified by what it writes, and several statements in one batch count as "other".
+    """
+    masked = _QUOTED_OR_NESTED.sub(lambda m: " " * len(m.group(0)), query).strip().rstrip(";")
+    first_word = re.match(r"\s*(\w*)", masked).group(1).upper()
+    statement_type = _STATEMENT_TYPES.get(first_word, "other")
+    if statement_type != "select":
+        return statement_type
+    write = _WRITE_KEYWORDS.search(masked)
+    if write:
+        return _STATEMENT_TYPES.get(write.group(1).upper(), "other")
+    if ";" in masked:
+        return "other"
+    return "select"
+
+def is_read_only_query(query: str) -> bool:
+    """True for a single SELECT that doesn't write anything"""
+    return classify_statement(query) == "select"
+
+_query_executor: Optional[ThreadPoolExecutor] = None
+
+def get_query_executor() -> ThreadPoolExecutor:
+    """Return the worker pool that runs blocking queries, sized to match the connection pool"""
+    global _query_executor
+    with _pool_lock:
+        if _query_executor is None:
+            _query_executor = ThreadPoolExecutor(
+                max_workers=SQL_POOL_MAX_SIZE,
+                thread_name_prefix="sql-query",
+            )
+        return _query_executor
+
+class QueryHandle:
+    """Lets the event loop cancel a query that is running on a worker thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cursor = None
+        self.cancelled = False
+
+    def attach(self, cursor) -> None:
+        """Register the cursor executing the query; fails if the query was already cancelled."""
+        with self._lock:
+            if self.cancelled:
+                raise RuntimeError("Query was cancelled before it started")
+            self._cursor = cursor
+
+    def cancel(self) -> None:
+        """Mark the query cancelled and ask SQL Server to stop executing it."""
+        with self._lock:
+            self.cancelled = True
+            cursor = self._cursor
+        if cursor is not None:
+            try:
+                cursor.cancel()
+            except Exception as e:
+                logger.warning(f"Failed to cancel running query: {e}")
+
+_QUOTED_OR_NESTED = re.compile(r"'(?:[^']|'')*'|\[(?:[^\]]|\]\])*\]|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+def _top_level_sql(query: str) -> str:
+    """
+    Return the query with string literals, quoted identifiers, comments and parenthesised
+    sub-expressions blanked out, keeping offsets, so keywords found in it are top-level.
+    """
+    masked = _QUOTED_OR_NESTED.sub(lambda m: " " * len(m.group(0)), query)
+    chars = list(masked)
+    depth = 0
+    for i, ch in enumerate(chars):
+        if ch == "(":
+            depth += 1
+            chars[i] = " "
+        elif ch == ")":
+            depth = max(depth - 1, 0)
+            chars[i] = " "
+        elif depth:
+            chars[i] = " "
+    return "".join(chars)
+
+_UNPAGEABLE = re.compile(r"\b(TOP|OFFSET|FETCH|INTO|FOR|OPTION|COMPUTE)\b", re.IGNORECASE)
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+
+def paginate_query(query: str, offset: int, limit: int, bind: bool = False) -> Optional[str]:
+    """
+    Rewrite a single SELECT so SQL Server returns only the requested page, using OFFSET ... FETCH.
+    With bind, the offset and limit become two trailing ? parameters so every page shares one
+    prepared statement. Returns None when the query can't be rewritten safely; callers then
+    page on the client side.
+    """
+    query = query.strip().rstrip(";").rstrip()
+    top_level = _top_level_sql(query)
+    if ";" in top_level or _UNPAGEABLE.search(top_level):
+        return None
+
+    first_word = re.match(r"\s*(\w*)", top_level)
+    keyword = first_word.group(1).upper()
+    if bind:
+        page = "OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+    else:
+        page = f"OFFSET {int(offset)} ROWS FETCH NEXT {int(limit)} ROWS ONLY"
+    if _ORDER_BY.search(top_level):
+        # The query already has a top-level ORDER BY, which OFFSET ... FETCH extends
+        if keyword in ("SELECT", "WITH"):
+            return f"{query}\n{page}"
+        return None
+    if keyword != "SELECT":
+        # CTEs can't be wrapped in a derived table
+        return None
+    return f"SELECT * FROM (\n{query}\n) AS _mcp_page ORDER BY (SELECT NULL) {page}"
+
+def encode_page_cursor(query: str, offset: int) -> str:
+    """Encode an opaque continuation token for the page starting at offset"""
+    token = {"o": offset, "h": hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]}
+    return base64.urlsafe_b64encode(json.dumps(token).encode("utf-8")).decode("ascii")
+
+def decode_page_cursor(query: str, cursor: str) -> int:
+    """Decode a continuation token, checking it was issued for the same query"""
     try:
-        conn = get_sql_connection()
-        cursor = conn.cursor()
-        
+        token = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset = int(token["o"])
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+    if token.get("h") != hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]:
+        raise ValueError("Pagination cursor was issued for a different query")
+    return offset
+
+def is_batch_params(params: Optional[List[Any]]) -> bool:
+    """True when params is a list of parameter lists for executemany"""
+    return bool(params) and isinstance(params[0], (list, tuple))
+
+def _freeze_params(params: Optional[List[Any]]) -> Optional[Tuple[Any, ...]]:
+    if params is None:
+        return None
+    return tuple(_freeze_params(value) if isinstance(value, list) else value for value in params)
+
+def execute_sql_query(
+    query: str,
+    handle: Optional[QueryHandle] = None,
+    max_rows: Optional[int] = None,
+    offset: int = 0,
+    cache_ttl: Optional[float] = None,
+    params: Optional[List[Any]] = None,
+    conn=None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Execute a SQL query and return the results as a list of dictionaries.
+    Runs on conn if given, otherwise on a connection borrowed from the pool.
+    With max_rows, only rows offset to offset + max_rows are fetched from the server.
+    params binds values to ? placeholders; a list of parameter lists runs the statement once
+    per list with fast_executemany.
+    Read-only SELECTs are served from the result cache; any other statement invalidates
+    cached results for the tables it touches. Queries on a caller's connection bypass the
+    cache, since earlier statements there (USE, SET ROWCOUNT, temp tables) may change what
+    the same text returns.
+    """
+    cache = get_result_cache()
+    read_only = is_read_only_query(query) and not is_batch_params(params)
+    cache_key = None
+    if conn is None and read_only and not _NONDETERMINISTIC.search(query) and cache_ttl != 0 and cache.default_ttl > 0:
+        cache_key = (SQL_DATABASE, normalize_query(query), _freeze_params(params), max_rows, offset)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+    generation = cache.generation
+
+    try:
+        if handle is not None and handle.cancelled:
+            raise RuntimeError("Query was cancelled before it started")
+        bind = params is not None
+        paged_query = paginate_query(query, offset, max_rows, bind=bind) if max_rows else None
+        result = None
+        borrowed = contextlib.nullcontext(conn) if conn is not None else get_connection_pool().connection()
+        with borrowed as conn:
+            if paged_query:
+                paged_params = list(params) + [offset, max_rows] if bind else None
+                try:
+                    result = _run_query(conn, paged_query, handle, max_rows=max_rows, params=paged_params, paged=True)
+                except pyodbc.Error as e:
+                    # e.g. a derived table with unnamed or duplicate columns; page on the client instead
+                    logger.info(f"Paged query rewrite failed, falling back to client-side paging: {e}")
+            if result is None:
+                result = _run_query(conn, query, handle, max_rows=max_rows, offset=offset, params=params)
+        if cache_key is not None:
+            cache.put(cache_key, result, referenced_tables(query), generation, cache_ttl)
+        return result
+    except Exception as e:
+        error_message = f"Error executing SQL query: {str(e)}"
+        logger.error(error_message)
+        return [], error_message
+    finally:
+        if not read_only:
+            # Even a failed batch may have committed some writes
+            cache.invalidate_tables(referenced_tables(query))
+
+def _describe_binary(value) -> str:
+    return f"BINARY DATA ({len(value)} bytes)"
+
+# Converters for values that aren't JSON-serializable, keyed on the pyodbc type code
+_VALUE_CONVERTERS: Dict[type, Callable[[Any], Any]] = {
+    datetime: datetime.isoformat,
+    bytes: _describe_binary,
+    bytearray: _describe_binary,
+}
+
+def _compile_function(name: str, source: str, namespace: Dict[str, Any]) -> Callable:
+    """Compile generated source defining function name, the way collections.namedtuple builds its classes"""
+    exec(source, namespace)
+    return namespace[name]
+
+class RowConverter:
+    """
+    Turns fetched rows into dictionaries. A conversion function is generated once from
+    cursor.description: it unpacks each row into locals and builds the dictionary with a
+    literal, calling a converter only for the columns whose type needs one.
+    """
+
+    def __init__(self, description):
+        self.columns = [column[0] for column in description]
+        namespace: Dict[str, Any] = {}
+        items = []
+        for index, column in enumerate(description):
+            converter = _VALUE_CONVERTERS.get(column[1])
+            value = f"v{index}"
+            if converter is not None:
+                namespace[f"convert{index}"] = converter
+                value = f"(None if v{index} is None else convert{index}(v{index}))"
+            items.append(f"{column[0]!r}: {value}")
+        targets = "".join(f"v{index}, " for index in range(len(description)))
+        self.convert = _compile_function(
+            "convert",
+            f"def convert(rows):\n    return [{{{', '.join(items)}}} for ({targets}) in rows]\n",
+            namespace,
+        )
+
+TEXT_FORMATS = ("markdown", "csv", "ndjson")
+
+class RowFormatter:
+    """Renders converted rows as markdown table lines, CSV or NDJSON, with the row template built once"""
+
+    def __init__(self, columns: List[str], output_format: str = "markdown"):
+        if output_format not in TEXT_FORMATS:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        # Rows are dictionaries, so duplicate column names collapse to one
+        self.columns = list(dict.fromkeys(columns))
+        self.output_format = output_format
+        self._line = ("| " + " | ".join(["{}"] * len(self.columns)) + " |\n").format
+        # Markdown rows are rendered by a generated function that unpacks each row's values
+        targets = "".join(f"v{index}, " for index in range(len(self.columns)))
+        cells = ", ".join(f"str(v{index})" for index in range(len(self.columns)))
+        self._markdown = _compile_function(
+            "markdown",
+            "def markdown(rows, values=dict.values):\n"
+            f"    return ''.join(['| ' + ' | '.join(({cells},)) + ' |\\n' for ({targets}) in map(values, rows)])\n",
+            {},
+        )
+
+    def _csv(self, rows: Iterable[Iterable[Any]]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue()
+
+    def header(self) -> str:
+        if self.output_format == "markdown":
+            return self._line(*self.columns) + self._line(*["---"] * len(self.columns))
+        if self.output_format == "csv":
+            return self._csv([self.columns])
+        return ""
+
+    def rows(self, rows: List[Dict[str, Any]]) -> str:
+        """Render rows, each terminated by a newline"""
+        if self.output_format == "markdown":
+            return self._markdown(rows)
+        if self.output_format == "csv":
+            return self._csv(row.values() for row in rows)
+        dumps = json.dumps
+        return "".join([dumps(row, default=str) + "\n" for row in rows])
+
+def _run_query(
+    conn,
+    query: str,
+    handle: Optional[QueryHandle] = None,
+    max_rows: Optional[int] = None,
+    offset: int = 0,
+    params: Optional[List[Any]] = None,
+    paged: bool = False,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Execute a query on a borrowed connection, skipping offset rows and reading at most max_rows.
+    paged says the query already limits itself to max_rows with OFFSET ... FETCH.
+    """
+    # Parameterized statements reuse the cursor that prepared them on this connection
+    pool = get_connection_pool()
+    reusable = params is not None
+    if reusable:
+        # pyodbc only skips SQLPrepare when given the very string object it prepared last,
+        # so equal texts from different requests must share one object
+        query = sys.intern(query)
+    cursor = pool.prepared_cursor(conn, query) if reusable else conn.cursor()
+    try:
+        if handle is not None:
+            handle.attach(cursor)
+
+        if is_batch_params(params):
+            cursor.fast_executemany = True
+            cursor.executemany(query, params)
+            conn.commit()
+            return [], f"Query executed successfully. Parameter sets executed: {len(params)}"
+
         # Execute the query
-        cursor.execute(query)
-        
+        if params is not None:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+
         # Check if this is a SELECT query with results
         if cursor.description:
-            # Get column names
-            columns = [column[0] for column in cursor.description]
-            
-            # Fetch all rows
-            rows = cursor.fetchall()
-            
-            # Convert rows to list of dictionaries
-            results = []
-            for row in rows:
-                # Convert any non-serializable types to strings
-                row_dict = {}
-                for i, value in enumerate(row):
-                    if isinstance(value, datetime):
-                        row_dict[columns[i]] = value.isoformat()
-                    elif isinstance(value, (bytes, bytearray)):
-                        row_dict[columns[i]] = f"BINARY DATA ({len(value)} bytes)"
-                    else:
-                        row_dict[columns[i]] = value
-                results.append(row_dict)
-            
+            converter = RowConverter(cursor.description)
+
+            if max_rows is None:
+                rows = cursor.fetchall()
+            else:
+                # Skip to the page, then stop reading; closing the cursor discards the rest
+                while offset > 0:
+                    skipped = cursor.fetchmany(min(offset, SQL_STREAM_BATCH_SIZE))
+                    if not skipped:
+                        break
+                    offset -= len(skipped)
+                rows = cursor.fetchmany(max_rows)
+                # A full page of a query paged on the client may leave rows on the server,
+                # which would keep the connection busy; OFFSET ... FETCH never returns more
+                if len(rows) == max_rows and not paged:
+                    reusable = False
+
+            # Convert rows to dictionaries
+            results = converter.convert(rows)
+
             return results, None
         else:
             # This was likely an INSERT, UPDATE, or DELETE
             conn.commit()
             affected_rows = cursor.rowcount
             return [], f"Query executed successfully. Affected rows: {affected_rows}"
-            
+    except Exception:
+        reusable = False
+        raise
+    finally:
+        if reusable:
+            try:
+                while cursor.nextset():
+                    pass
+                pool.return_prepared_cursor(conn, query, cursor)
+            except pyodbc.Error:
+                cursor.close()
+        else:
+            # Closing discards any unread results so the connection can be reset and reused
+            cursor.close()
+
+def execute_sql_batches(
+    batches: List[str],
+    handle: Optional[QueryHandle] = None,
+    max_rows: Optional[int] = None,
+) -> List[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """
+    Execute batches one after another on a single connection, so session state such as
+    temp tables carries from one batch to the next. Like SSMS, a failed batch doesn't stop the rest.
+    Results of scripts are never cached, as they depend on that session state.
+    """
+    try:
+        with get_connection_pool().connection() as conn:
+            return [
+                execute_sql_query(batch, handle, max_rows=max_rows, conn=conn)
+                for batch in batches
+            ]
     except Exception as e:
         error_message = f"Error executing SQL query: {str(e)}"
         logger.error(error_message)
-        return [], error_message
+        return [([], error_message)]
+
+async def _run_cancellable(call: Callable[[QueryHandle], Any], timeout: Optional[float], on_timeout: Callable[[str], Any]) -> Any:
+    """
+    Run call(handle) on the query executor without blocking the event loop.
+    The query is cancelled on the server if it exceeds the timeout or the request goes away.
+    """
+    if timeout is None or timeout <= 0 or timeout > SQL_QUERY_TIMEOUT:
+        timeout = SQL_QUERY_TIMEOUT
+
+    handle = QueryHandle()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_query_executor(), call, handle)
+    try:
+        # wait_for cancels the future on timeout, which also drops it from the executor queue if it hasn't started
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        handle.cancel()
+        error_message = f"Error executing SQL query: Query cancelled after exceeding the {timeout}s timeout"
+        logger.error(error_message)
+        return on_timeout(error_message)
+    except asyncio.CancelledError:
+        handle.cancel()
+        raise
+
+async def run_sql_query(
+    query: str,
+    timeout: Optional[float] = None,
+    max_rows: Optional[int] = None,
+    offset: int = 0,
+    cache_ttl: Optional[float] = None,
+    params: Optional[List[Any]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Run execute_sql_query off the event loop, cancelling it after timeout seconds"""
+    return await _run_cancellable(
+        lambda handle: execute_sql_query(query, handle, max_rows, offset, cache_ttl, params),
+        timeout,
+        lambda error_message: ([], error_message),
+    )
+
+async def run_sql_batches(
+    batches: List[str],
+    timeout: Optional[float] = None,
+    max_rows: Optional[int] = None,
+) -> List[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """Run execute_sql_batches off the event loop; the timeout covers the whole script"""
+    return await _run_cancellable(
+        lambda handle: execute_sql_batches(batches, handle, max_rows),
+        timeout,
+        lambda error_message: [([], error_message)],
+    )
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object that buffers output until drained, while reporting the total position"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+class ColumnarEncoder:
+    """
+    Encode fetched row batches as an Arrow IPC stream or a Parquet file. Column types are
+    chosen once from cursor.description and each batch is built column by column, so values
+    keep their native types (timestamps, decimals, binary) instead of being stringified.
+    """
+
+    def __init__(self, description, output_format: str):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for Arrow and Parquet output")
+        fields = []
+        self._converters: List[Optional[Callable[[Any], Any]]] = []
+        for name, type_code, _, _, precision, scale, _ in description:
+            arrow_type, converter = self._arrow_type(type_code, precision, scale)
+            fields.append(pa.field(name, arrow_type))
+            self._converters.append(converter)
+        self.schema = pa.schema(fields)
+        self._sink = _DrainableSink()
+        if output_format == "parquet":
+            self._writer = pq.ParquetWriter(self._sink, self.schema)
+        else:
+            self._writer = pa.ipc.new_stream(self._sink, self.schema)
+
+    @staticmethod
+    def _arrow_type(type_code, precision, scale):
+        """Map a pyodbc type code to an Arrow type and an optional per-value converter"""
+        if type_code is bool:
+            return pa.bool_(), None
+        if type_code is int:
+            return pa.int64(), None
+        if type_code is float:
+            return pa.float64(), None
+        if type_code is decimal.Decimal and precision and 0 < precision <= 38:
+            return pa.decimal128(precision, scale or 0), None
+        if type_code is datetime:
+            return pa.timestamp("us"), None
+        if type_code is date:
+            return pa.date32(), None
+        if type_code is dt_time:
+            return pa.time64("us"), None
+        if type_code in (bytes, bytearray):
+            return pa.binary(), None
+        if type_code is str:
+            return pa.string(), None
+        # uuid.UUID and anything unexpected travel as text
+        return pa.string(), str
+
+    def encode(self, rows) -> bytes:
+        columns = list(zip(*rows))
+        arrays = []
+        for values, field, converter in zip(columns, self.schema, self._converters):
+            if converter is not None:
+                values = [None if value is None else converter(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+def _produce_query_batches(
+    query: str,
+    handle: QueryHandle,
+    batch_size: int,
+    emit: Callable[[Tuple[str, Any]], None],
+    output_format: Optional[str] = None,
+    params: Optional[List[Any]] = None,
+) -> None:
+    """
+    Execute a query and hand its output to emit as ("columns", names), then ("rows", batch)
+    for every fetchmany batch, finishing with ("done", message) or ("error", message).
+    Batches are lists of dictionaries, or encoded bytes for the "arrow" and "parquet" formats.
+    Runs on the query executor; emit blocks while the consumer is behind.
+    """
+    read_only = is_read_only_query(query)
+    try:
+        if handle.cancelled:
+            raise RuntimeError("Query was cancelled before it started")
+        with get_connection_pool().connection() as conn:
+            cursor = conn.cursor()
+            try:
+                handle.attach(cursor)
+                if params is not None:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+
+                if cursor.description:
+                    columns = [column[0] for column in cursor.description]
+                    encoder = ColumnarEncoder(cursor.description, output_format) if output_format else None
+                    converter = RowConverter(cursor.description)
+                    emit(("columns", columns))
+                    row_count = 0
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        row_count += len(rows)
+                        if encoder is not None:
+                            emit(("rows", encoder.encode(rows)))
+                        else:
+                            emit(("rows", converter.convert(rows)))
+                    if encoder is not None:
+                        emit(("rows", encoder.finish()))
+                    emit(("done", f"Query executed successfully. Returned rows: {row_count}"))
+                else:
+                    conn.commit()
+                    emit(("done", f"Query executed successfully. Affected rows: {cursor.rowcount}"))
+            finally:
+                cursor.close()
+    except Exception as e:
+        error_message = f"Error executing SQL query: {str(e)}"
+        logger.error(error_message)
+        if not handle.cancelled:
+            emit(("error", error_message))
     finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+        if not read_only:
+            get_result_cache().invalidate_tables(referenced_tables(query))
+
+async def stream_sql_query(
+    query: str,
+    timeout: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    output_format: Optional[str] = None,
+    params: Optional[List[Any]] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Stream a query's output as it is fetched, holding at most a couple of batches in memory.
+    The timeout applies to the wait for each batch rather than to the whole result.
+    """
+    if timeout is None or timeout <= 0 or timeout > SQL_QUERY_TIMEOUT:
+        timeout = SQL_QUERY_TIMEOUT
+    if not batch_size or batch_size <= 0:
+        batch_size = SQL_STREAM_BATCH_SIZE
+
+    handle = QueryHandle()
+    loop = asyncio.get_running_loop()
+    # A small bounded queue gives backpressure: the worker stops fetching while the client is slow
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+
+    def emit(item: Tuple[str, Any]) -> None:
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            if handle.cancelled:
+                future.cancel()
+                raise RuntimeError("Query was cancelled")
+            try:
+                future.result(timeout=0.5)
+                return
+            except FutureTimeoutError:
+                continue
+
+    worker = loop.run_in_executor(get_query_executor(), _produce_query_batches, query, handle, batch_size, emit, output_format, params)
+    try:
+        while True:
+            try:
+                kind, payload = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                handle.cancel()
+                error_message = f"Error executing SQL query: Query cancelled after exceeding the {timeout}s timeout"
+                logger.error(error_message)
+                yield "error", error_message
+                return
+            yield kind, payload
+            if kind in ("done", "error"):
+                return
+    finally:
+        # The client went away or we gave up waiting; stop the query on the server
+        if not worker.done():
+            handle.cancel()
+
+COLUMNAR_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+async def _columnar_response(mcp_request: MCPRequest, query: str):
+    """
+    Stream the result set as an Arrow IPC stream or a Parquet file. The first event is awaited
+    before responding so errors and statements without a result set still get a JSON reply.
+    """
+    if pa is None:
+        return JSONResponse({
+            "error": "Arrow and Parquet output require pyarrow to be installed on the server"
+        }, status_code=400)
+
+    events = stream_sql_query(
+        query, mcp_request.timeout, mcp_request.batch_size, mcp_request.format, mcp_request.params
+    )
+    kind, payload = await events.__anext__()
+    if kind != "columns":
+        await events.aclose()
+        if kind == "error":
+            return JSONResponse({"error": payload}, status_code=500)
+        return JSONResponse({"message": payload})
+
+    async def body():
+        async for kind, payload in events:
+            if kind == "rows":
+                yield payload
+            elif kind == "error":
+                # Headers are already sent; ending early leaves a truncated stream the reader will reject
+                return
+
+    return StreamingResponse(body(), media_type=COLUMNAR_MEDIA_TYPES[mcp_request.format])
+
+def _stream_response(mcp_request: MCPRequest, query: str) -> StreamingResponse:
+    """Build a streaming response as NDJSON rows or OpenAI-style SSE chat completion chunks"""
+    events = stream_sql_query(query, mcp_request.timeout, mcp_request.batch_size, params=mcp_request.params)
+
+    if mcp_request.stream_format == "ndjson":
+        formatter = RowFormatter([], "ndjson")
+
+        async def ndjson_body():
+            async for kind, payload in events:
+                if kind == "columns":
+                    yield json.dumps({"columns": payload}) + "\n"
+                elif kind == "rows":
+                    yield formatter.rows(payload)
+                else:
+                    yield json.dumps({kind: payload}) + "\n"
+
+        return StreamingResponse(ndjson_body(), media_type="application/x-ndjson")
+
+    created = int(datetime.now().timestamp())
+
+    def chunk(content: str, finish_reason: Optional[str] = None) -> str:
+        data = {
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": "mssql-mcp-server",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason,
+                }
+            ],
+        }
+        return f"data: {json.dumps(data)}\n\n"
+
+    async def sse_body():
+        formatter = None
+        async for kind, payload in events:
+            if kind == "columns":
+                formatter = RowFormatter(payload, mcp_request.format)
+                yield chunk("Query executed successfully. Results:\n\n" + formatter.header())
+            elif kind == "rows":
+                yield chunk(formatter.rows(payload))
+            elif kind == "done":
+                yield chunk("" if formatter else payload, finish_reason="stop")
+            else:
+                yield chunk(payload, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(sse_body(), media_type="text/event-stream")
+
+_SQL_FENCE = re.compile(r"```sql[ \t]*\r?\n?(.*?)```", re.DOTALL | re.IGNORECASE)
+_GO_LINE = re.compile(r"^[ \t]*GO(?:[ \t]+(\d+))?[ \t]*;?[ \t]*\r?$", re.IGNORECASE | re.MULTILINE)
+
+def _last_user_message(messages: List[Dict[str, str]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else ""
+    return ""
+
+def split_sql_batches(script: str) -> List[str]:
+    """Split a script into batches on GO lines; "GO n" runs the preceding batch n times"""
+    # Blank out literals and comments (keeping newlines) so a GO inside them isn't a separator
+    masked = _QUOTED_OR_NESTED.sub(lambda m: re.sub(r"[^\n]", " ", m.group(0)), script)
+    batches = []
+    start = 0
+    for match in _GO_LINE.finditer(masked):
+        batch = script[start:match.start()].strip()
+        if batch:
+            batches.extend([batch] * int(match.group(1) or 1))
+        start = match.end()
+    batch = script[start:].strip()
+    if batch:
+        batches.append(batch)
+    return batches
+
+def extract_sql_batches(messages: List[Dict[str, str]]) -> List[str]:
+    """
+    Extract the SQL batches to run from the last user message: every ```sql fenced block in
+    order, or the whole message if it has none, split into batches on GO lines.
+    """
+    message = _last_user_message(messages)
+    blocks = [block for block in _SQL_FENCE.findall(message) if block.strip()] or [message]
+    batches = []
+    for block in blocks:
+        batches.extend(split_sql_batches(block))
+    return batches
 
 def extract_sql_query(messages: List[Dict[str, str]]) -> str:
     """
     Extract SQL query from messages.
-    This function looks for the last user message and tries to find a SQL query in it.
+    Returns the SQL found in the last user message as one script, with batches separated by GO lines.
     """
-    # Get the last user message
-    user_messages = [msg for msg in messages if msg.get("role") == "user"]
-    if not user_messages:
-        return ""
-    
-    last_user_message = user_messages[-1]["content"]
-    
-    # Try to extract anything that looks like a SQL query
-    # This is a simple approach - you might want to improve this based on your needs
-    # Look for content between ```sql and ``` or just plain SQL statements
-    
-    # First, try to find SQL code blocks
-    if "```sql" in last_user_message:
-        parts = last_user_message.split("```sql")
-        if len(parts) > 1:
-            query_part = parts[1].split("```")[0].strip()
-            if query_part:
-                return query_part
-    
-    # Then, try to find any SQL-like statements
-    sql_keywords = ["SELECT", "INSERT", "UPDATE", "DELETE", "CREATE", "ALTER", "DROP"]
-    for keyword in sql_keywords:
-        if keyword in last_user_message.upper():
-            # Very simple heuristic: return everything after finding a SQL keyword
-            # In a real implementation, you might want more sophisticated parsing
-            return last_user_message
-    
-    return last_user_message  # Return the message as is if no SQL pattern detected
+    return "\nGO\n".join(extract_sql_batches(messages))
+
+def _format_result(results: List[Dict[str, Any]], message: Optional[str], output_format: str) -> str:
+    """Render one query's rows as a markdown table, CSV or NDJSON, or its status/error message"""
+    if results:
+        formatter = RowFormatter(list(results[0].keys()), output_format)
+        return (
+            "Query executed successfully. Results:\n\n"
+            + formatter.header()
+            + formatter.rows(results).rstrip("\n")
+        )
+    return message or "Query executed successfully. No results returned."
+
+def _completion_response(content: str, **extra: Any) -> JSONResponse:
+    """Wrap content in an MCP-compatible chat completion response"""
+    response = {
+        "choices": [
+            {
+                "message": {
+                    "role": "assistant",
+                    "content": content
+                },
+                "finish_reason": "stop",
+            }
+        ],
+        "created": int(datetime.now().timestamp()),
+        "model": "mssql-mcp-server",
+    }
+    response.update(extra)
+    return JSONResponse(response)
+
+async def _batches_response(mcp_request: MCPRequest, batches: List[str], limit: int) -> JSONResponse:
+    """Run a multi-batch script and report each batch's first limit rows in turn"""
+    outcomes = await run_sql_batches(batches, mcp_request.timeout, max_rows=limit + 1)
+    sections = []
+    for number, (results, message) in enumerate(outcomes, start=1):
+        section = f"Batch {number}:\n" + _format_result(results[:limit], message, mcp_request.format)
+        if len(results) > limit:
+            section += f"\n\n*Showing the first {limit} rows.*"
+        sections.append(section)
+    return _completion_response("\n\n".join(sections), batches=len(batches))
 
-async def mcp_endpoint(request: Request) -> JSONResponse:
+async def mcp_endpoint(request: Request):
     """MCP-compatible endpoint for SQL query execution"""
     try:
         mcp_request = await parse_mcp_request(request)
         
-        # Extract SQL query from the request
-        query = extract_sql_query(mcp_request.messages)
+        # Use the explicit query template if given, otherwise extract the SQL from the messages
+        if mcp_request.query:
+            batches = split_sql_batches(mcp_request.query)
+        else:
+            batches = extract_sql_batches(mcp_request.messages)
         
-        if not query:
+        if not batches:
             return JSONResponse({
                 "error": "No SQL query found in the messages"
             }, status_code=400)
+        if mcp_request.params is not None and not isinstance(mcp_request.params, list):
+            return JSONResponse({
+                "error": "params must be a list of values, or a list of parameter lists for a batch"
+            }, status_code=400)
+        if is_batch_params(mcp_request.params) and (mcp_request.stream or mcp_request.format in COLUMNAR_MEDIA_TYPES):
+            return JSONResponse({
+                "error": "Batched params can't be combined with streaming or columnar output"
+            }, status_code=400)
         
-        # Execute the query
-        results, error = execute_sql_query(query)
-        
-        if error:
-            # Return the error message if there was a problem
-            response_content = f"Error executing SQL query: {error}"
-        else:
-            # Format the results as a nice table if there are results
-            if results:
-                # Format as markdown table
-                columns = results[0].keys()
-                table_header = " | ".join(columns)
-                separator = " | ".join(["---" for _ in columns])
-                table_rows = [" | ".join([str(row.get(col, "")) for col in columns]) for row in results]
-                
-                response_content = f"Query executed successfully. Results:\n\n| {table_header} |\n| {separator} |\n"
-                response_content += "\n".join([f"| {row} |" for row in table_rows])
-                
-                # If there are too many results, add a note
-                if len(results) > 50:
-                    response_content += f"\n\n*Showing {len(results)} records. Total records: {len(results)}*"
+        if mcp_request.format not in TEXT_FORMATS and mcp_request.format not in COLUMNAR_MEDIA_TYPES:
+            return JSONResponse({
+                "error": f"Unsupported format: {mcp_request.format}"
+            }, status_code=400)
+
+        # The server-side ceiling always applies
+        try:
+            limit = int(mcp_request.max_rows or SQL_DEFAULT_ROWS)
+        except (TypeError, ValueError) as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        if limit <= 0:
+            return JSONResponse({"error": "max_rows must be positive"}, status_code=400)
+        limit = min(limit, SQL_MAX_ROWS)
+
+        if len(batches) > 1:
+            if mcp_request.params is not None or mcp_request.stream or mcp_request.format in COLUMNAR_MEDIA_TYPES:
+                return JSONResponse({
+                    "error": "params, streaming and columnar output need a single SQL batch"
+                }, status_code=400)
+            return await _batches_response(mcp_request, batches, limit)
+        query = batches[0]
+
+        if mcp_request.format in COLUMNAR_MEDIA_TYPES:
+            return await _columnar_response(mcp_request, query)
+        if mcp_request.stream:
+            return _stream_response(mcp_request, query)
+
+        # Work out the page to return
+        page_key = query
+        if mcp_request.params is not None:
+            page_key += "\n" + json.dumps(mcp_request.params, default=str)
+        try:
+            if mcp_request.cursor:
+                offset = decode_page_cursor(page_key, mcp_request.cursor)
             else:
-                response_content = error if error else "Query executed successfully. No results returned."
-        
-        # Create the MCP-compatible response
-        response = {
-            "choices": [
-                {
-                    "message": {
-                        "role": "assistant",
-                        "content": response_content
-                    },
-                    "finish_reason": "stop",
-                }
-            ],
-            "created": int(datetime.now().timestamp()),
-            "model": "mssql-mcp-server"
-        }
+                offset = int(mcp_request.offset or 0)
+        except (TypeError, ValueError) as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        if offset < 0:
+            return JSONResponse({"error": "offset must not be negative"}, status_code=400)
+
+        # Execute the query off the event loop, fetching one extra row to tell whether more remain
+        results, error = await run_sql_query(
+            query,
+            mcp_request.timeout,
+            max_rows=limit + 1,
+            offset=offset,
+            cache_ttl=mcp_request.cache_ttl,
+            params=mcp_request.params,
+        )
+        has_more = len(results) > limit
+        results = results[:limit]
+        next_cursor = encode_page_cursor(page_key, offset + limit) if has_more else None
         
-        return JSONResponse(response)
+        response_content = _format_result(results, error, mcp_request.format)
+        # If there are more rows, tell the client how to get the next page
+        if has_more:
+            response_content += (
+                f"\n\n*Showing rows {offset + 1}-{offset + len(results)}. More rows are available; "
+                f"send \"cursor\": \"{next_cursor}\" to fetch the next page.*"
+            )
+
+        return _completion_response(
+            response_content,
+            statement_type=classify_statement(query),
+            pagination={
+                "offset": offset,
+                "returned": len(results),
+                "has_more": has_more,
+                "next_cursor": next_cursor,
+            },
+        )
     
     except Exception as e:
         logger.exception("Error processing request")
@@ -201,13 +1477,255 @@ async def mcp_endpoint(request: Request) -> JSONResponse:
             "error": str(e)
         }, status_code=500)
 
+_IDENTIFIER_PART = re.compile(r"\[((?:[^\]]|\]\])+)\]|([A-Za-z_#@$][\w#@$ ]*)")
+
+def quote_identifier(name: str) -> str:
+    """Quote a column name for SQL Server"""
+    if not name:
+        raise ValueError("Empty identifier")
+    return "[" + name.replace("]", "]]") + "]"
+
+def quote_table_name(name: str) -> str:
+    """Validate a possibly schema-qualified table name and return it with every part bracket-quoted"""
+    parts = []
+    position = 0
+    while True:
+        match = _IDENTIFIER_PART.match(name, position)
+        if not match:
+            raise ValueError(f"Invalid table name: {name}")
+        part = match.group(1).replace("]]", "]") if match.group(1) is not None else match.group(2).strip()
+        parts.append(quote_identifier(part))
+        position = match.end()
+        if position == len(name):
+            break
+        if name[position] != ".":
+            raise ValueError(f"Invalid table name: {name}")
+        position += 1
+    if len(parts) > 3:
+        raise ValueError(f"Invalid table name: {name}")
+    return ".".join(parts)
+
+BULK_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+
+class BulkLoader:
+    """
+    Inserts batches of rows into one table with fast_executemany, all inside a single
+    transaction on one borrowed connection. Every method runs on the query executor.
+    """
+
+    def __init__(self, table: str, columns: List[str]):
+        column_list = ", ".join(quote_identifier(column) for column in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        self.sql = f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})"
+        self.rows = 0
+        self.batches = 0
+        self._conn = None
+        self._cursor = None
+
+    def open(self) -> None:
+        self._conn = get_connection_pool().acquire()
+        self._cursor = self._conn.cursor()
+        self._cursor.fast_executemany = True
+
+    def write(self, rows: List[Tuple[Any, ...]]) -> None:
+        self._cursor.executemany(self.sql, rows)
+        self.rows += len(rows)
+        self.batches += 1
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def close(self) -> None:
+        """Return the connection; the pool's reset rolls back anything not committed."""
+        if self._conn is None:
+            return
+        try:
+            self._cursor.close()
+        except Exception:
+            pass
+        get_connection_pool().release(self._conn)
+        self._conn = None
+
+async def _read_lines(request: Request) -> AsyncIterator[str]:
+    """Decode the request body as UTF-8 and yield it line by line as it arrives"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    remainder = ""
+    async for chunk in request.stream():
+        text = remainder + decoder.decode(chunk)
+        lines = text.split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line
+    remainder += decoder.decode(b"", final=True)
+    if remainder:
+        yield remainder
+
+async def _parse_csv(request: Request) -> AsyncIterator[Tuple[Any, ...]]:
+    """Yield the CSV header as a tuple, then each record; empty fields become NULL"""
+    record: List[str] = []
+    quotes = 0
+    async for line in _read_lines(request):
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            # Still inside a quoted field that spans lines
+            continue
+        text = "\n".join(record)
+        record, quotes = [], 0
+        if not text.strip():
+            continue
+        for values in csv.reader([text]):
+            yield tuple(value if value != "" else None for value in values)
+    if record:
+        raise ValueError("CSV body ends inside a quoted field")
+
+async def _parse_ndjson(request: Request) -> AsyncIterator[Tuple[Any, ...]]:
+    """Yield the keys of the first object as the header, then each object's values in that order"""
+    columns = None
+    async for line in _read_lines(request):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError("Each NDJSON line must be a JSON object")
+        if columns is None:
+            columns = list(record)
+            yield tuple(columns)
+        yield tuple(record.get(column) for column in columns)
+
+def _read_next_batch(reader) -> Optional[Any]:
+    # StopIteration can't be raised through an executor future
+    try:
+        return reader.read_next_batch()
+    except StopIteration:
+        return None
+
+async def _parse_arrow(request: Request) -> AsyncIterator[Tuple[Any, ...]]:
+    """
+    Spool an Arrow IPC stream (to disk once it gets large), then yield the schema's column
+    names followed by the rows of each record batch.
+    """
+    if pa is None:
+        raise ValueError("Arrow input requires pyarrow to be installed on the server")
+    loop = asyncio.get_running_loop()
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        reader = await loop.run_in_executor(None, pa.ipc.open_stream, spool)
+        yield tuple(reader.schema.names)
+        while True:
+            batch = await loop.run_in_executor(None, _read_next_batch, reader)
+            if batch is None:
+                break
+            for row in zip(*(column.to_pylist() for column in batch.columns)):
+                yield row
+
+_BULK_PARSERS = {
+    "csv": _parse_csv,
+    "ndjson": _parse_ndjson,
+    "arrow": _parse_arrow,
+}
+
+async def bulk_endpoint(request: Request) -> JSONResponse:
+    """
+    Bulk-load a CSV, NDJSON or Arrow IPC request body into a table. The body is parsed as it
+    streams in and inserted in batches with fast_executemany inside a single transaction;
+    the next batch is parsed while the previous one is being written.
+    """
+    try:
+        table = quote_table_name(request.path_params["table"])
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        body_format = request.query_params.get("format") or BULK_CONTENT_TYPES.get(content_type)
+        if body_format not in _BULK_PARSERS:
+            raise ValueError("Send text/csv, application/x-ndjson or application/vnd.apache.arrow.stream")
+        batch_size = int(request.query_params.get("batch_size", SQL_BULK_BATCH_SIZE))
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    loop = asyncio.get_running_loop()
+    executor = get_query_executor()
+    start = time.monotonic()
+    loader: Optional[BulkLoader] = None
+    pending = None
+    try:
+        records = _BULK_PARSERS[body_format](request)
+        header = await records.__anext__()
+        loader = BulkLoader(table, list(header))
+        await loop.run_in_executor(executor, loader.open)
+
+        batch: List[Tuple[Any, ...]] = []
+        async for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                if pending is not None:
+                    await pending
+                pending = loop.run_in_executor(executor, loader.write, batch)
+                batch = []
+        if pending is not None:
+            await pending
+            pending = None
+        if batch:
+            await loop.run_in_executor(executor, loader.write, batch)
+        await loop.run_in_executor(executor, loader.commit)
+    except StopAsyncIteration:
+        return JSONResponse({"error": "The request body contains no rows"}, status_code=400)
+    except Exception as e:
+        logger.exception("Bulk load failed")
+        status_code = 400 if isinstance(e, (ValueError, csv.Error)) else 500
+        return JSONResponse({"error": f"Bulk load failed, no rows were committed: {str(e)}"}, status_code=status_code)
+    finally:
+        if pending is not None:
+            # Let an in-flight batch finish before the connection goes back to the pool
+            await asyncio.wait([pending])
+        if loader is not None:
+            await loop.run_in_executor(executor, loader.close)
+            get_result_cache().invalidate_tables(referenced_tables(f"INSERT INTO {table}"))
+
+    elapsed = time.monotonic() - start
+    return JSONResponse({
+        "table": table,
+        "rows": loader.rows,
+        "batches": loader.batches,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(loader.rows / elapsed, 1) if elapsed > 0 else None,
+    })
+
+async def stats_endpoint(request: Request) -> JSONResponse:
+    """Report connection pool and result cache usage"""
+    return JSONResponse({
+        "pool": get_connection_pool().stats(),
+        "cache": get_result_cache().stats(),
+    })
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    """Warm the connection pool on startup and close it on shutdown"""
+    pool = get_connection_pool()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, pool.fill)
+    except Exception as e:
+        # Don't refuse to start if SQL Server is briefly unavailable; connections are opened on demand
+        logger.warning(f"Could not pre-fill connection pool: {e}")
+    yield
+    get_query_executor().shutdown(wait=False)
+    pool.close()
+
 # Define Starlette routes
 routes = [
     Route("/v1/chat/completions", mcp_endpoint, methods=["POST"]),
+    Route("/v1/bulk/{table}", bulk_endpoint, methods=["POST"]),
+    Route("/v1/stats", stats_endpoint, methods=["GET"]),
 ]
 
 # Create Starlette application
-app = Starlette(routes=routes)
+app = Starlette(routes=routes, lifespan=lifespan)
 
 if __name__ == "__main__":
     import uvicorn
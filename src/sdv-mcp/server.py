@@ -1,5 +1,5 @@
 from mcp.server.fastmcp import FastMCP
-from tools import generate, evaluate, visualize
+from tools import generate, sample, evaluate, visualize
 
 
 # Create FastMCP instance
@@ -7,26 +7,52 @@ mcp = FastMCP("sdv_mcp")
 
 
 @mcp.tool()
-def sdv_generate(folder_name: str) -> str:
+def sdv_generate(folder_name: str, refit: bool = False) -> str:
     """Generate synthetic data based on real data using SDV Synthesizer.
 
     This tool reads CSV files from the specified folder, creates a synthetic
-    version of that data, and saves it to a 'synthetic_data' folder.
+    version of that data, and saves it to a 'synthetic_data' folder. The fitted
+    synthesizer is kept in the model store and reused while the CSV files and
+    metadata.json are unchanged.
 
     Args:
         folder_name (str): Path to folder containing CSV data files and metadata.json
+        refit (bool): Fit a new synthesizer even if a stored one matches the data
 
     Returns:
         str: Success message with information about generated tables
     """
     try:
-        return generate(folder_name)
+        return generate(folder_name, refit)
     except FileNotFoundError as e:
         return f"Error: {str(e)}"
     except RuntimeError as e:
         return f"Error: {str(e)}"
 
 
+@mcp.tool()
+def sdv_sample(folder_name: str, scale: float = 1.0) -> str:
+    """Generate synthetic data from the stored synthesizer without refitting.
+
+    This tool loads the synthesizer that sdv_generate fitted on the current data
+    in the specified folder, samples from it, and saves the result to the
+    'synthetic_data' folder.
+
+    Args:
+        folder_name (str): Path to folder containing CSV data files and metadata.json
+        scale (float): Size of the synthetic data relative to the real data, e.g. 10 for ten times as many rows
+
+    Returns:
+        str: Success message with information about generated tables
+    """
+    try:
+        return sample(folder_name, scale)
+    except (FileNotFoundError, ValueError) as e:
+        return f"Error: {str(e)}"
+    except RuntimeError as e:
+        return f"Error: {str(e)}"
+
+
 @mcp.tool()
 def sdv_evaluate(folder_name: str) -> dict:
     """Evaluate the quality of synthetic data compared to real data.
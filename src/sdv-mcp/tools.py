@@ -1,12 +1,190 @@
+import glob
+import hashlib
+import math
 import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import pandas as pd
+import sdv
 from sdv.io.local import CSVHandler
 from sdv.metadata import Metadata
 from sdv.multi_table import HMASynthesizer
 from sdv.evaluation.multi_table import evaluate_quality, get_column_plot
 
 
-def generate(folder_name: str):
+# Folder where fitted synthesizers are saved, one file per dataset fingerprint
+MODEL_STORE = os.getenv("SDV_MODEL_STORE", "models")
+
+# Sampling is split into chunks of at most this scale, sampled in parallel by worker processes
+SDV_CHUNK_SCALE = float(os.getenv("SDV_CHUNK_SCALE", "1.0"))
+SDV_SAMPLE_WORKERS = int(os.getenv("SDV_SAMPLE_WORKERS", str(os.cpu_count() or 1)))
+
+
+def dataset_fingerprint(folder_name: str) -> str:
+    """Hash the CSV files and metadata.json in a folder, along with the SDV version."""
+    digest = hashlib.sha256(f"sdv {sdv.__version__}\n".encode())
+    paths = sorted(glob.glob(os.path.join(folder_name, "*.csv")))
+    paths.append(os.path.join(folder_name, "metadata.json"))
+    for path in paths:
+        digest.update(f"{os.path.basename(path)}\n".encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def model_path(folder_name: str) -> str:
+    """Path of the stored synthesizer for the current contents of a data folder."""
+    return os.path.join(MODEL_STORE, f"{dataset_fingerprint(folder_name)}.pkl")
+
+
+def load_or_fit(folder_name: str, metadata_file: str, refit: bool = False):
+    """Load the stored synthesizer for this data, or fit one and store it.
+
+    Returns the synthesizer, its path in the model store and whether it was loaded from there.
+    """
+    path = model_path(folder_name)
+    if not refit and os.path.exists(path):
+        return HMASynthesizer.load(path), path, True
+
+    # Load CSV data files from the specified folder
+    connector = CSVHandler()
+    data = connector.read(folder_name=folder_name)
+
+    # Load metadata
+    metadata = Metadata.load_from_json(metadata_file)
+
+    # Create and train synthesizer
+    synthesizer = HMASynthesizer(metadata)
+    synthesizer.fit(data)
+
+    # Save under a temporary name first so a crash never leaves a partial model behind
+    os.makedirs(MODEL_STORE, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    synthesizer.save(temp_path)
+    os.replace(temp_path, path)
+    return synthesizer, path, False
+
+
+def chunk_scales(scale: float, chunk_scale: float) -> list:
+    """Split a sampling scale into chunks no larger than chunk_scale."""
+    count = max(1, math.ceil(scale / chunk_scale - 1e-9))
+    return [chunk_scale] * (count - 1) + [round(scale - chunk_scale * (count - 1), 9)]
+
+
+def seed_synthesizer(synthesizer, seed: int):
+    """Give a synthesizer its own random stream for the next sample.
+
+    A loaded HMASynthesizer always starts sampling from the same fixed seeds, so worker
+    processes would otherwise all produce the same rows. SDV has no public way to seed
+    sampling; these are the states its reset_sampling() restores.
+    """
+    synthesizer._numpy_seed = seed
+    for table_synthesizer in synthesizer._table_synthesizers.values():
+        table_synthesizer._set_random_state(seed)
+
+
+# The synthesizer each sampling worker process loads once, at startup
+_worker_synthesizer = None
+
+
+def _init_sample_worker(path: str):
+    global _worker_synthesizer
+    _worker_synthesizer = HMASynthesizer.load(path)
+
+
+def _sample_chunk(index: int, scale: float) -> tuple:
+    seed_synthesizer(_worker_synthesizer, index)
+    return index, _worker_synthesizer.sample(scale=scale)
+
+
+def remap_keys(chunk: dict, metadata: Metadata, index: int, next_keys: dict):
+    """Make a chunk's primary keys unique across chunks, updating the foreign keys that reference them.
+
+    Chunks are sampled independently, so each one numbers its keys from the start again.
+    Integer keys are shifted past the largest key written so far for their table (tracked
+    in next_keys); other keys are prefixed with the chunk index.
+    """
+    shifts = {}
+    for table_name, df in chunk.items():
+        primary_key = metadata.tables[table_name].primary_key
+        if not primary_key or primary_key not in df:
+            continue
+        keys = df[primary_key]
+        if pd.api.types.is_integer_dtype(keys):
+            if keys.empty:
+                continue
+            shift = next_keys.get(table_name, 0) - int(keys.min())
+            next_keys[table_name] = int(keys.max()) + shift + 1
+            df[primary_key] = keys + shift
+        else:
+            shift = f"{index}-"
+            df[primary_key] = shift + keys.astype(str)
+        shifts[table_name] = shift
+
+    for relationship in metadata.relationships:
+        shift = shifts.get(relationship["parent_table_name"])
+        child = chunk.get(relationship["child_table_name"])
+        foreign_key = relationship["child_foreign_key"]
+        if shift is None or child is None or foreign_key not in child:
+            continue
+        keys = child[foreign_key]
+        if isinstance(shift, str):
+            child[foreign_key] = keys.where(keys.isna(), shift + keys.astype(str))
+        else:
+            child[foreign_key] = keys + shift
+
+
+def write_synthetic_data(synthesizer, path: str, scale: float) -> dict:
+    """Sample from a fitted synthesizer and save each table to the 'synthetic_data' folder.
+
+    Scales above SDV_CHUNK_SCALE are sampled in chunks across a pool of worker processes,
+    and each chunk is appended to the CSV files as soon as it's ready, so memory use
+    depends on the chunk size rather than the total scale. Returns the rows written per table.
+    """
+    scales = chunk_scales(scale, SDV_CHUNK_SCALE)
+    metadata = synthesizer.get_metadata()
+    os.makedirs("synthetic_data", exist_ok=True)
+    rows = {}
+    next_keys = {}
+
+    def append(index: int, chunk: dict):
+        if len(scales) > 1:
+            remap_keys(chunk, metadata, index, next_keys)
+        for table_name, df in chunk.items():
+            # Written under a temporary name until every chunk is in, so a failed run never looks complete
+            output_file = os.path.join("synthetic_data", f"{table_name}.csv.tmp")
+            df.to_csv(output_file, mode="a" if table_name in rows else "w", header=table_name not in rows, index=False)
+            rows[table_name] = rows.get(table_name, 0) + len(df)
+
+    if len(scales) == 1:
+        append(0, synthesizer.sample(scale=scales[0]))
+    else:
+        workers = max(1, min(SDV_SAMPLE_WORKERS, len(scales)))
+        with ProcessPoolExecutor(workers, initializer=_init_sample_worker, initargs=(path,)) as pool:
+            queued = iter(enumerate(scales))
+
+            def submit_next(pending: set):
+                for index, chunk_scale in queued:
+                    pending.add(pool.submit(_sample_chunk, index, chunk_scale))
+                    return
+
+            # Only a few chunks are in flight at once, which bounds how many sit in memory
+            pending = set()
+            for _ in range(workers * 2):
+                submit_next(pending)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    append(*future.result())
+                    submit_next(pending)
+
+    for table_name in rows:
+        output_file = os.path.join("synthetic_data", f"{table_name}.csv")
+        os.replace(f"{output_file}.tmp", output_file)
+    return rows
+
+
+def generate(folder_name: str, refit: bool = False):
     """Generate synthetic data based on real data using SDV Synthesizer."""
     # Check if the data folder exists
     if not os.path.exists(folder_name):
@@ -18,31 +196,51 @@ def generate(folder_name: str):
         raise FileNotFoundError(f"The metadata file {metadata_file} does not exist.")
 
     try:
-        # Load CSV data files from the specified folder
-        connector = CSVHandler()
-        data = connector.read(folder_name=folder_name)
+        # Reuse the synthesizer fitted on this exact data, if there is one
+        synthesizer, path, reused = load_or_fit(folder_name, metadata_file, refit)
+
+        # Generate synthetic data and save it to CSV files
+        synthetic_data = write_synthetic_data(synthesizer, path, scale=1)
+
+        model_note = "using the stored model" if reused else "after fitting a new model"
+        return f"Data generated successfully {model_note} and saved in 'synthetic_data' folder with {len(synthetic_data)} tables named as {list(synthetic_data.keys())} CSV files."
+
+    # Handle exceptions during data generation
+    except Exception as e:
+        raise RuntimeError(f"An error occurred while generating synthetic data: {e}")
 
-        # Load metadata
-        metadata = Metadata.load_from_json(metadata_file)
 
-        # Create and train synthesizer
-        synthesizer = HMASynthesizer(metadata)
-        synthesizer.fit(data)
+def sample(folder_name: str, scale: float = 1.0):
+    """Generate synthetic data from the stored synthesizer for a data folder, without refitting."""
+    # Check if the data folder exists
+    if not os.path.exists(folder_name):
+        raise FileNotFoundError(f"The folder {folder_name} does not exist.")
+
+    # Check if metadata file exists
+    metadata_file = os.path.join(folder_name, "metadata.json")
+    if not os.path.exists(metadata_file):
+        raise FileNotFoundError(f"The metadata file {metadata_file} does not exist.")
 
-        # Generate synthetic data
-        synthetic_data = synthesizer.sample(scale=1)
+    if scale <= 0:
+        raise ValueError("scale must be greater than 0")
 
-        # Save synthetic data to CSV files
-        os.makedirs("synthetic_data", exist_ok=True)
-        for table_name, df in synthetic_data.items():
-            output_file = os.path.join("synthetic_data", f"{table_name}.csv")
-            df.to_csv(output_file, index=False)
+    # A changed CSV or metadata file means a different fingerprint, so a stale model is never used
+    path = model_path(folder_name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No fitted model found for the current data in {folder_name}. Please run the SDV generate method first."
+        )
 
-        return f"Data generated successfully and saved in 'synthetic_data' folder with {len(synthetic_data)} tables named as {list(synthetic_data.keys())} CSV files."
+    try:
+        synthesizer = HMASynthesizer.load(path)
+        rows = write_synthetic_data(synthesizer, path, scale=scale)
 
-    # Handle exceptions during data generation
+        table_rows = ", ".join(f"{table_name} ({count} rows)" for table_name, count in rows.items())
+        return f"Data sampled successfully at scale {scale} and saved in 'synthetic_data' folder with {len(rows)} tables: {table_rows}."
+
+    # Handle exceptions during sampling
     except Exception as e:
-        raise RuntimeError(f"An error occurred while generating synthetic data: {e}")
+        raise RuntimeError(f"An error occurred while sampling synthetic data: {e}")
 
 
 def evaluate(folder_name: str):
@@ -1,29 +1,205 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
 from typing import Any
+import asyncio
+import itertools
+import json
+import os
+import re
+import tempfile
+import time
 import httpx
 from mcp.server.fastmcp import FastMCP
 
 ##https://modelcontextprotocol.io/quickstart/server
 
-# Initialize FastMCP server
-mcp = FastMCP("weather")
-
 # Constants
 NWS_API_BASE = "https://api.weather.gov"
 USER_AGENT = "weather-app/1.0"
+RESPONSE_CACHE_SIZE = 256
+# Requests a batch tool runs at once
+MAX_CONCURRENT_REQUESTS = 8
+# /points lookups (lat,lon -> forecast grid) practically never change, so they're kept for a long time and on disk
+POINTS_CACHE_TTL = float(os.getenv("NWS_POINTS_CACHE_TTL", str(30 * 24 * 3600)))
+# Alert feeds: how often watched states are polled, how long a state stays watched
+# without being read, and how many changes per state are kept for cursors
+ALERT_POLL_INTERVAL = float(os.getenv("NWS_ALERT_POLL_INTERVAL", "60"))
+ALERT_WATCH_TTL = float(os.getenv("NWS_ALERT_WATCH_TTL", "3600"))
+ALERT_CHANGE_LOG_SIZE = 1000
+POINTS_CACHE_PATH = os.getenv("NWS_POINTS_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "weather", "points.json"))
+
+_client: httpx.AsyncClient | None = None
+_poller: asyncio.Task | None = None
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide NWS client, keeping connections alive between requests."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "application/geo+json"
+            },
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+        )
+    return _client
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    """Stop the alert poller and close the shared client when the server stops."""
+    try:
+        yield
+    finally:
+        if _poller is not None:
+            _poller.cancel()
+        if _client is not None:
+            await _client.aclose()
+
+# Initialize FastMCP server
+mcp = FastMCP("weather", lifespan=lifespan)
+
+@dataclass
+class CachedResponse:
+    data: dict[str, Any]
+    expires_at: float
+    last_modified: str | None
+    etag: str | None
+
+_responses: OrderedDict[str, CachedResponse] = OrderedDict()
+
+def freshness_lifetime(headers: httpx.Headers) -> float:
+    """Seconds a response may be reused without revalidation, from Cache-Control or Expires."""
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0.0
+    max_age = re.search(r"max-age=(\d+)", cache_control)
+    if max_age:
+        return max(0.0, int(max_age.group(1)) - float(headers.get("Age", "0") or 0))
+    if "Expires" in headers:
+        try:
+            return max(0.0, parsedate_to_datetime(headers["Expires"]).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
 
 async def make_nws_request(url: str) -> dict[str, Any] | None:
-    """Make a request to the NWS API with proper error handling."""
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/geo+json"
+    """Make a request to the NWS API with proper error handling.
+
+    Responses are cached for as long as their Cache-Control/Expires headers allow, and
+    stale ones are revalidated with If-Modified-Since/If-None-Match, so an unchanged
+    resource costs a 304 rather than a full download.
+    """
+    cached = _responses.get(url)
+    if cached is not None and time.time() < cached.expires_at:
+        _responses.move_to_end(url)
+        return cached.data
+
+    headers = {}
+    if cached is not None:
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+    try:
+        response = await get_client().get(url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            cached.expires_at = time.time() + freshness_lifetime(response.headers)
+            _responses.move_to_end(url)
+            return cached.data
+        response.raise_for_status()
+        data = response.json()
+    except Exception:
+        return None
+
+    if response.headers.get("Last-Modified") or response.headers.get("ETag") or freshness_lifetime(response.headers):
+        _responses[url] = CachedResponse(
+            data=data,
+            expires_at=time.time() + freshness_lifetime(response.headers),
+            last_modified=response.headers.get("Last-Modified"),
+            etag=response.headers.get("ETag"),
+        )
+        _responses.move_to_end(url)
+        while len(_responses) > RESPONSE_CACHE_SIZE:
+            _responses.popitem(last=False)
+    return data
+
+_points: dict[str, dict[str, Any]] | None = None
+_points_save_lock: asyncio.Lock | None = None
+# Whether _points has lookups that haven't been written to disk yet
+_points_dirty = False
+
+def _load_points() -> dict[str, dict[str, Any]]:
+    try:
+        with open(POINTS_CACHE_PATH, encoding="utf-8") as f:
+            points = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {key: entry for key, entry in points.items() if now - entry.get("stored_at", 0) < POINTS_CACHE_TTL}
+
+def _save_points(points: dict[str, dict[str, Any]]) -> None:
+    directory = os.path.dirname(POINTS_CACHE_PATH)
+    temp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # A temp file of its own, so a save can never pick up another one's half-written file
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".points-", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(points, f)
+        os.replace(temp_path, POINTS_CACHE_PATH)
+    except OSError:
+        # The cache is an optimisation; keep going with the in-memory copy
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+async def save_points() -> None:
+    """Write new lookups in the points cache to disk, one save at a time."""
+    global _points_save_lock, _points_dirty
+    if _points_save_lock is None:
+        _points_save_lock = asyncio.Lock()
+    async with _points_save_lock:
+        if _points is None or not _points_dirty:
+            return
+        _points_dirty = False
+        await asyncio.to_thread(_save_points, dict(_points))
+
+async def get_forecast_grid(latitude: float, longitude: float, save: bool = True) -> dict[str, Any] | None:
+    """Look up the NWS forecast grid for a location.
+
+    Coordinates are rounded to 4 decimal places (about 10 m, the precision /points
+    accepts), and lookups are cached in memory and on disk for POINTS_CACHE_TTL.
+    With save=False a new lookup is only kept in memory until the next save_points().
+    """
+    global _points, _points_dirty
+    if _points is None:
+        _points = await asyncio.to_thread(_load_points)
+
+    key = f"{round(latitude, 4)},{round(longitude, 4)}"
+    entry = _points.get(key)
+    if entry is not None and time.time() - entry["stored_at"] < POINTS_CACHE_TTL:
+        return entry
+
+    points_data = await make_nws_request(f"{NWS_API_BASE}/points/{key}")
+    if not points_data:
+        return None
+
+    props = points_data["properties"]
+    entry = {
+        "gridId": props.get("gridId"),
+        "gridX": props.get("gridX"),
+        "gridY": props.get("gridY"),
+        "forecast": props["forecast"],
+        "forecastHourly": props.get("forecastHourly"),
+        "stored_at": time.time(),
     }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except Exception:
-            return None
+    _points[key] = entry
+    _points_dirty = True
+    if save:
+        await save_points()
+    return entry
 
 def format_alert(feature: dict) -> str:
     """Format an alert feature into a readable string."""
@@ -36,24 +212,44 @@ Description: {props.get('description', 'No description available')}
 Instructions: {props.get('instruction', 'No specific instructions provided')}
 """
 
-@mcp.tool()
-async def get_alerts(state: str) -> str:
-    """Get weather alerts for a US state.
-
-    Args:
-        state: Two-letter US state code (e.g. CA, NY)
-    """
+async def fetch_alerts(state: str) -> tuple[bool, str]:
+    """Fetch and format the active alerts for a state, returning (succeeded, text)."""
     url = f"{NWS_API_BASE}/alerts/active/area/{state}"
     data = await make_nws_request(url)
 
     if not data or "features" not in data:
-        return "Unable to fetch alerts or no alerts found."
+        return False, "Unable to fetch alerts or no alerts found."
 
     if not data["features"]:
-        return "No active alerts for this state."
+        return True, "No active alerts for this state."
 
     alerts = [format_alert(feature) for feature in data["features"]]
-    return "\n---\n".join(alerts)
+    return True, "\n---\n".join(alerts)
+
+def format_forecast(forecast_data: dict[str, Any]) -> str:
+    """Format the next forecast periods into a readable string."""
+    periods = forecast_data["properties"]["periods"]
+    forecasts = []
+    for period in periods[:5]:  # Only show next 5 periods
+        forecast = f"""
+{period['name']}:
+Temperature: {period['temperature']}°{period['temperatureUnit']}
+Wind: {period['windSpeed']} {period['windDirection']}
+Forecast: {period['detailedForecast']}
+"""
+        forecasts.append(forecast)
+
+    return "\n---\n".join(forecasts)
+
+@mcp.tool()
+async def get_alerts(state: str) -> str:
+    """Get weather alerts for a US state.
+
+    Args:
+        state: Two-letter US state code (e.g. CA, NY)
+    """
+    _, text = await fetch_alerts(state)
+    return text
 
 @mcp.tool()
 async def get_forecast(latitude: float, longitude: float) -> str:
@@ -63,33 +259,222 @@ async def get_forecast(latitude: float, longitude: float) -> str:
         latitude: Latitude of the location
         longitude: Longitude of the location
     """
-    # First get the forecast grid endpoint
-    points_url = f"{NWS_API_BASE}/points/{latitude},{longitude}"
-    points_data = await make_nws_request(points_url)
+    # First get the forecast grid endpoint (usually cached)
+    grid = await get_forecast_grid(latitude, longitude)
 
-    if not points_data:
+    if not grid:
         return "Unable to fetch forecast data for this location."
 
-    # Get the forecast URL from the points response
-    forecast_url = points_data["properties"]["forecast"]
-    forecast_data = await make_nws_request(forecast_url)
+    forecast_data = await make_nws_request(grid["forecast"])
 
     if not forecast_data:
         return "Unable to fetch detailed forecast."
 
-    # Format the periods into a readable forecast
-    periods = forecast_data["properties"]["periods"]
-    forecasts = []
-    for period in periods[:5]:  # Only show next 5 periods
-        forecast = f"""
-{period['name']}:
-Temperature: {period['temperature']}°{period['temperatureUnit']}
-Wind: {period['windSpeed']} {period['windDirection']}
-Forecast: {period['detailedForecast']}
-"""
-        forecasts.append(forecast)
+    return format_forecast(forecast_data)
 
-    return "\n---\n".join(forecasts)
+async def gather_bounded(coros: list, limit: int = MAX_CONCURRENT_REQUESTS) -> list:
+    """Await coroutines with at most limit running at once, returning results in order."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+@mcp.tool()
+async def get_forecast_batch(locations: list[list[float]]) -> str:
+    """Get weather forecasts for many locations at once.
+
+    Locations in the same NWS grid cell share one forecast request. Each location
+    gets its own section, and a location that fails doesn't fail the others.
+
+    Args:
+        locations: List of [latitude, longitude] pairs
+    """
+    valid = {}
+    sections = [None] * len(locations)
+    for index, location in enumerate(locations):
+        if len(location) != 2:
+            sections[index] = f"[{index + 1}] {location}\nError: expected [latitude, longitude]"
+        else:
+            valid[index] = (float(location[0]), float(location[1]))
+
+    # Resolve each distinct location to its grid, then fetch each distinct grid's forecast once
+    coordinates = list(dict.fromkeys((round(lat, 4), round(lon, 4)) for lat, lon in valid.values()))
+    grids = dict(zip(coordinates, await gather_bounded([get_forecast_grid(lat, lon, save=False) for lat, lon in coordinates])))
+    # One write of the points cache for the whole batch
+    await save_points()
+    forecast_urls = list(dict.fromkeys(grid["forecast"] for grid in grids.values() if grid))
+    forecasts = dict(zip(forecast_urls, await gather_bounded([make_nws_request(url) for url in forecast_urls])))
+
+    succeeded = 0
+    for index, (lat, lon) in valid.items():
+        grid = grids[(round(lat, 4), round(lon, 4))]
+        if not grid:
+            text = "Error: Unable to fetch forecast data for this location."
+        elif not forecasts.get(grid["forecast"]):
+            text = "Error: Unable to fetch detailed forecast."
+        else:
+            text = format_forecast(forecasts[grid["forecast"]])
+            succeeded += 1
+        cell = f" (grid {grid['gridId']} {grid['gridX']},{grid['gridY']})" if grid else ""
+        sections[index] = f"[{index + 1}] {lat}, {lon}{cell}\n{text}"
+
+    summary = f"{succeeded} of {len(locations)} forecasts retrieved from {len(forecast_urls)} grid cells."
+    return "\n===\n".join([summary] + sections)
+
+@mcp.tool()
+async def get_alerts_batch(states: list[str]) -> str:
+    """Get weather alerts for several US states at once.
+
+    Each state gets its own section, and a state that fails doesn't fail the others.
+
+    Args:
+        states: Two-letter US state codes (e.g. ["CA", "NY"])
+    """
+    states = list(dict.fromkeys(state.strip().upper() for state in states))
+    results = await gather_bounded([fetch_alerts(state) for state in states])
+
+    succeeded = sum(1 for ok, _ in results if ok)
+    sections = [
+        f"[{state}]\n{text if ok else 'Error: ' + text}"
+        for state, (ok, text) in zip(states, results)
+    ]
+    summary = f"Alerts retrieved for {succeeded} of {len(states)} states."
+    return "\n===\n".join([summary] + sections)
+
+
+@dataclass
+class AlertFeed:
+    """Active alerts for one watched state and a log of the changes between polls."""
+    alerts: dict[str, dict[str, Any]] = field(default_factory=dict)
+    # (version, kind, feature) with kind "new", "updated" or "expired"
+    changes: deque = field(default_factory=deque)
+    version: int = 0
+    # Changes up to this version have been dropped from the log
+    floor: int = 0
+    last_read: float = field(default_factory=time.time)
+    # Distinguishes this feed from earlier ones for the same state, whose versions it reuses
+    generation: int = field(default_factory=lambda: next(_feed_generations))
+
+_feeds: dict[str, AlertFeed] = {}
+# Cursors from before a restart can't be resolved against the new feeds
+_feed_epoch = format(int(time.time()), "x")
+_feed_generations = itertools.count(1)
+
+def alert_id(feature: dict) -> str:
+    return feature["properties"].get("id") or feature.get("id")
+
+async def refresh_feed(state: str, feed: AlertFeed) -> bool:
+    """Fetch a state's active alerts and record what's new, updated or expired since the last poll."""
+    data = await make_nws_request(f"{NWS_API_BASE}/alerts/active/area/{state}")
+    if not data or "features" not in data:
+        return False
+
+    current = {alert_id(feature): feature for feature in data["features"]}
+    changes = []
+    for key, feature in current.items():
+        previous = feed.alerts.get(key)
+        if previous is None:
+            changes.append(("new", feature))
+        elif previous["properties"].get("updated") != feature["properties"].get("updated"):
+            changes.append(("updated", feature))
+    changes.extend(("expired", feature) for key, feature in feed.alerts.items() if key not in current)
+
+    if changes:
+        feed.version += 1
+        feed.changes.extend((feed.version, kind, feature) for kind, feature in changes)
+        while len(feed.changes) > ALERT_CHANGE_LOG_SIZE:
+            feed.floor = feed.changes.popleft()[0]
+    feed.alerts = current
+    return True
+
+async def poll_alerts() -> None:
+    """Refresh every watched state on one schedule, dropping states nobody has read for ALERT_WATCH_TTL."""
+    while True:
+        now = time.time()
+        for state in [state for state, feed in _feeds.items() if now - feed.last_read > ALERT_WATCH_TTL]:
+            del _feeds[state]
+        try:
+            await gather_bounded([refresh_feed(state, feed) for state, feed in list(_feeds.items())])
+        except Exception:
+            # A malformed response for one state shouldn't stop the poller
+            pass
+        await asyncio.sleep(ALERT_POLL_INTERVAL)
+
+def format_expired_alert(feature: dict) -> str:
+    props = feature["properties"]
+    return f"{props.get('event', 'Unknown')} for {props.get('areaDesc', 'Unknown')} (ID: {alert_id(feature)})"
+
+@mcp.tool()
+async def get_alert_updates(state: str, cursor: str = "") -> str:
+    """Get only the alerts for a US state that are new, updated or expired since a cursor.
+
+    The first call (without a cursor) returns all active alerts and starts watching the
+    state; a background poller then refreshes every watched state on one schedule.
+    Pass the returned cursor to the next call to get just the changes.
+
+    Args:
+        state: Two-letter US state code (e.g. CA, NY)
+        cursor: Cursor returned by the previous call, or empty for all active alerts
+    """
+    global _poller
+    state = state.strip().upper()
+    feed = _feeds.get(state)
+    if feed is None:
+        feed = AlertFeed()
+        if not await refresh_feed(state, feed):
+            return "Unable to fetch alerts or no alerts found."
+        _feeds[state] = feed
+        if _poller is None or _poller.done():
+            _poller = asyncio.create_task(poll_alerts())
+    feed.last_read = time.time()
+
+    since = None
+    epoch, _, rest = cursor.partition(":")
+    cursor_state, _, version = rest.partition(":")
+    if (
+        epoch == f"{_feed_epoch}.{feed.generation}"
+        and cursor_state == state
+        and version.isdigit()
+        and feed.floor <= int(version) <= feed.version
+    ):
+        since = int(version)
+
+    if since is None:
+        # No usable cursor: report every active alert as new
+        changes = {key: ("new", feature) for key, feature in feed.alerts.items()}
+    else:
+        # Collapse several changes to one alert into the net change since the cursor
+        changes = {}
+        for change_version, kind, feature in feed.changes:
+            if change_version <= since:
+                continue
+            key = alert_id(feature)
+            previous = changes.get(key)
+            if previous and previous[0] == "new":
+                if kind == "expired":
+                    del changes[key]
+                    continue
+                kind = "new"
+            changes[key] = (kind, feature)
+
+    lines = [f"Cursor: {_feed_epoch}.{feed.generation}:{state}:{feed.version}"]
+    if not changes:
+        lines.append("No alert changes since the last check.")
+        return "\n".join(lines)
+
+    for kind, title in (("new", "New alerts"), ("updated", "Updated alerts"), ("expired", "Expired alerts")):
+        features = [feature for change_kind, feature in changes.values() if change_kind == kind]
+        if not features:
+            continue
+        lines.append(f"\n{title} ({len(features)}):")
+        if kind == "expired":
+            lines.extend(format_expired_alert(feature) for feature in features)
+        else:
+            lines.append("\n---\n".join(format_alert(feature) for feature in features))
+    return "\n".join(lines)
 
 
 if __name__ == "__main__":
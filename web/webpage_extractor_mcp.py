@@ -1,27 +1,867 @@
+import asyncio
+import codecs
+import hashlib
+import json
 import os
+import re
+import shutil
+import sqlite3
 import sys
-import json
+import threading
+import time
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime
+from html import escape as html_escape
+from html.parser import HTMLParser
 from typing import Optional
-# Add the parent directory to the Python path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from mcp.server.fastmcp import FastMCP
-from common.webpage_extractor.webpage_extractor.extract_cleaner_webpage_sync import extract_clean_content
+from urllib.parse import urljoin, urldefrag, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+from mcp.server.fastmcp import Context, FastMCP
+import httpx
+from playwright.async_api import async_playwright
 import uvicorn
 
+# Browser pool settings
+WEB_BROWSER = os.getenv("WEB_BROWSER", "firefox")
+WEB_POOL_SIZE = int(os.getenv("WEB_POOL_SIZE", "4"))
+WEB_NAV_TIMEOUT = float(os.getenv("WEB_NAV_TIMEOUT", "30"))
+# Fast (HTTP-only) mode: pages with less text than this are assumed to need JavaScript
+WEB_FAST_MIN_TEXT = int(os.getenv("WEB_FAST_MIN_TEXT", "200"))
+WEB_FAST_MAX_BYTES = int(os.getenv("WEB_FAST_MAX_BYTES", str(5 * 1024 * 1024)))
+USER_AGENT = os.getenv("WEB_USER_AGENT", "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0")
+
+# Extraction cache settings; a TTL of 0 disables the cache
+WEB_CACHE_DIR = os.getenv("WEB_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "webpage-extractor"))
+WEB_CACHE_TTL = float(os.getenv("WEB_CACHE_TTL", "3600"))
+WEB_CACHE_MAX_BYTES = int(os.getenv("WEB_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+
+# Crawler settings: pages extracted at once, per host, and the minimum gap between requests to a host
+WEB_CRAWL_CONCURRENCY = int(os.getenv("WEB_CRAWL_CONCURRENCY", "16"))
+WEB_CRAWL_PER_HOST = int(os.getenv("WEB_CRAWL_PER_HOST", "4"))
+WEB_CRAWL_DELAY = float(os.getenv("WEB_CRAWL_DELAY", "0.25"))
+
 # Initialize FastMCP server
 mcp = FastMCP("webpage-extractor")
 
 # Get the ASGI app from the MCP server
 app = mcp.sse_app()
 
+class BrowserPool:
+    """
+    One headless browser shared by all extractions, with a fixed set of warm browser
+    contexts handed out one per page. The number of contexts is also the number of pages
+    rendered at once; further extractions wait for a context to come back.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._playwright = None
+        self._browser = None
+        # One slot per context for the pool's lifetime; a slot holds a warm context or
+        # None when its context died and has to be recreated by the next borrower
+        self._contexts: Optional[asyncio.Queue] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+
+    async def _ensure_started(self):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            if self._browser is not None:
+                # Crashed or disconnected; close what is left of it before relaunching
+                dead, self._browser = self._browser, None
+                try:
+                    await dead.close()
+                except Exception:
+                    pass
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await getattr(self._playwright, WEB_BROWSER).launch(headless=True)
+            if self._contexts is None:
+                self._contexts = asyncio.Queue()
+                for _ in range(self.size):
+                    self._contexts.put_nowait(await self._browser.new_context())
+
+    async def _checkout(self):
+        """Take a slot and make sure it holds a live context of the current browser"""
+        context = await self._contexts.get()
+        if context is not None and context.browser is self._browser and self._browser.is_connected():
+            return context
+        if context is not None:
+            try:
+                await context.close()
+            except Exception:
+                pass
+        try:
+            await self._ensure_started()
+            return await self._browser.new_context()
+        except Exception:
+            self._contexts.put_nowait(None)
+            raise
+
+    @asynccontextmanager
+    async def page(self):
+        """Borrow a context and open a fresh page in it; the context goes back to the pool afterwards"""
+        await self._ensure_started()
+        context = await self._checkout()
+        page = None
+        try:
+            page = await context.new_page()
+            yield page
+        finally:
+            try:
+                if page is not None:
+                    await page.close()
+                # Don't leak one site's session into the next extraction
+                await context.clear_cookies()
+            except Exception:
+                # The context (or the whole browser) died; the next borrower of this slot
+                # creates a new one
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+                context = None
+            self._contexts.put_nowait(context)
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        self._contexts = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+browser_pool = BrowserPool(WEB_POOL_SIZE)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Shut the browser and HTTP client down with the server"""
+    yield
+    if _background_writes:
+        await asyncio.gather(*_background_writes, return_exceptions=True)
+    await browser_pool.close()
+    if _http_client is not None:
+        await _http_client.aclose()
+
+app.router.lifespan_context = lifespan
+
+# Elements that never hold page content
+_DROP_TAGS = {"script", "style", "noscript", "iframe", "svg", "template", "nav", "header", "footer", "aside", "form"}
+# Elements reported as main content, and their types
+_CONTENT_TYPES = {
+    "h1": "heading", "h2": "heading", "h3": "heading", "h4": "heading", "h5": "heading", "h6": "heading",
+    "p": "paragraph",
+    "li": "list_item",
+    "pre": "code",
+    "blockquote": "quote",
+}
+# Closing one of these implicitly closes the content blocks opened inside it
+_CONTAINER_TAGS = {"ul", "ol", "div", "section", "main", "article", "body", "td", "table"}
+_JS_REQUIRED = re.compile(r"enable javascript|javascript (is )?(required|disabled)|requires javascript", re.IGNORECASE)
+
+class StreamingCleaner(HTMLParser):
+    """
+    Single-pass HTML cleaner that can be fed the page in chunks as it downloads.
+
+    Collects the title, links (including those in navigation, so site menus can be
+    followed) and main content blocks ({type, text}) in document order, and re-emits
+    the markup minus scripts, styles, comments and page furniture as the cleaned HTML.
+    Blocks inside <main>/<article> are preferred when the page has any.
+    """
+
+    def __init__(self, url: str):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        self.title = ""
+        self.links: list[dict] = []
+        self.js_required_hint = False
+        self._seen_links: set[str] = set()
+        self._out: list[str] = []
+        self._drop: list[str] = []
+        self._in_title = False
+        self._main_depth = 0
+        self._blocks: list[tuple[bool, dict]] = []
+        self._open_block: Optional[tuple[str, list[str]]] = None
+        self._block_depth = 0
+        self._link: Optional[tuple[str, list[str]]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._drop:
+            if tag == self._drop[-1]:
+                self._drop.append(tag)
+            self._start_link(tag, attrs)
+            return
+        if tag in _DROP_TAGS:
+            self._drop.append(tag)
+            return
+        self._out.append(self.get_starttag_text())
+        if tag == "title":
+            self._in_title = True
+        elif tag in ("main", "article"):
+            self._main_depth += 1
+        if self._open_block is not None and self._open_block[0] == "p" and (tag in _CONTENT_TYPES or tag in _CONTAINER_TAGS):
+            # A paragraph can't contain blocks, so a new block ends it
+            self._close_block()
+        if tag in _CONTENT_TYPES:
+            if self._open_block is None:
+                self._open_block = (tag, [])
+                self._block_depth = 1
+            elif tag == self._open_block[0] and tag in ("p", "li"):
+                # <p> and <li> end implicitly when the next one starts
+                self._close_block()
+                self._open_block = (tag, [])
+                self._block_depth = 1
+            else:
+                self._block_depth += 1
+        self._start_link(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        if not self._drop and tag not in _DROP_TAGS:
+            self._out.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._link is not None:
+            href, text = self._link
+            self.links.append({"text": " ".join("".join(text).split()), "url": href})
+            self._link = None
+        if self._drop:
+            if tag == self._drop[-1]:
+                self._drop.pop()
+            return
+        self._out.append(f"</{tag}>")
+        if tag == "title":
+            self._in_title = False
+        elif tag in ("main", "article"):
+            self._main_depth = max(0, self._main_depth - 1)
+        if self._open_block is not None:
+            if tag in _CONTENT_TYPES:
+                self._block_depth -= 1
+                if self._block_depth <= 0 or tag == self._open_block[0]:
+                    self._close_block()
+            elif tag in _CONTAINER_TAGS:
+                self._close_block()
+
+    def handle_data(self, data):
+        if self._link is not None:
+            self._link[1].append(data)
+        if self._drop:
+            if self._drop[0] == "noscript" and _JS_REQUIRED.search(data):
+                self.js_required_hint = True
+            return
+        self._out.append(html_escape(data, quote=False))
+        if self._in_title:
+            self.title += data
+        elif self._open_block is not None:
+            self._open_block[1].append(data)
+
+    def handle_decl(self, decl):
+        self._out.append(f"<!{decl}>")
+
+    def _start_link(self, tag, attrs):
+        if tag != "a":
+            return
+        href = (dict(attrs).get("href") or "").strip()
+        if not href or href.startswith(("javascript:", "mailto:", "tel:", "#")):
+            return
+        link_url = urldefrag(urljoin(self.url, href))[0]
+        if link_url not in self._seen_links:
+            self._seen_links.add(link_url)
+            self._link = (link_url, [])
+
+    def _close_block(self):
+        tag, parts = self._open_block
+        text = " ".join("".join(parts).split())
+        if text:
+            self._blocks.append((self._main_depth > 0, {"type": _CONTENT_TYPES[tag], "text": text}))
+        self._open_block = None
+        self._block_depth = 0
+
+    def result(self) -> tuple[str, dict]:
+        """Finish parsing; returns the cleaned HTML and clean_data"""
+        self.close()
+        if self._open_block is not None:
+            self._close_block()
+        in_main = [block for inside, block in self._blocks if inside]
+        main_content = in_main or [block for _, block in self._blocks]
+        clean_data = {"title": " ".join(self.title.split()), "url": self.url, "main_content": main_content, "links": self.links}
+        return "".join(self._out), clean_data
+
+def clean_html(html: str, url: str) -> tuple[str, dict]:
+    """
+    Clean a rendered page: returns the cleaned HTML and clean_data with the title,
+    main content blocks ({type, text}) in document order, and links ({text, url}).
+    """
+    cleaner = StreamingCleaner(url)
+    cleaner.feed(html)
+    return cleaner.result()
+
+# Artifact file extensions and the result keys their paths are reported under
+_ARTIFACT_KEYS = {"png": "screenshot_path", "html": "html_path", "json": "json_path", "txt": "text_path"}
+
+def build_artifacts(clean_html_text: str, clean_data: dict, screenshot: Optional[bytes]) -> dict[str, bytes]:
+    """Encode the files saved for an extraction, keyed by extension"""
+    artifacts = {
+        "html": clean_html_text.encode("utf-8"),
+        "json": json.dumps(clean_data, ensure_ascii=False, indent=2).encode("utf-8"),
+        "txt": (clean_data["title"] + "\n\n" + "\n\n".join(item["text"] for item in clean_data["main_content"])).encode("utf-8"),
+    }
+    if screenshot is not None:
+        artifacts["png"] = screenshot
+    return artifacts
+
+def _save_artifacts(output_dir: str, stem: str, artifacts: dict[str, bytes]) -> dict:
+    """Write the artifacts into output_dir; returns their paths"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for ext, data in artifacts.items():
+        path = os.path.join(output_dir, f"{stem}.{ext}")
+        with open(path, "wb") as f:
+            f.write(data)
+        paths[_ARTIFACT_KEYS[ext]] = path
+    return paths
+
+def normalize_url(url: str) -> str:
+    """Cache key for a URL: lower-case scheme and host, no default port or fragment, "/" for an empty path"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+# ioctl that makes a copy-on-write clone of a file on btrfs, XFS and similar filesystems
+_FICLONE = 0x40049409
+
+def _copy_file(source: str, path: str):
+    """Copy source to path as a reflink where possible, sharing blocks until either file is changed"""
+    if sys.platform.startswith("linux"):
+        import fcntl  # not available on Windows
+        try:
+            with open(source, "rb") as src, open(path, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            return
+        except OSError:
+            pass
+    shutil.copyfile(source, path)
+
+class ExtractionCache:
+    """
+    Disk cache of extractions keyed by normalized URL.
+
+    Artifacts are stored once per content hash under objects/, so pages that render to
+    the same bytes (and the unchanged files of re-extracted pages) share storage, and are
+    copied into output_dir (as reflinks where the filesystem supports them), so editing an
+    output file never changes the cache. Entries are fresh for
+    WEB_CACHE_TTL seconds, after which they're revalidated with the ETag/Last-Modified
+    the page was served with. When the objects outgrow WEB_CACHE_MAX_BYTES, the least
+    recently used pages are dropped along with objects nothing else references.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.directory, "index.db"), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT,"
+                " fetched_at REAL, last_access REAL, artifacts TEXT)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, ext TEXT, size INTEGER)")
+            self._db.commit()
+        return self._db
+
+    def _object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], f"{digest}.{ext}")
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """The cached entry for key, fresh or stale, or None"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT url, etag, last_modified, fetched_at, artifacts FROM pages WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = {"url": row[0], "etag": row[1], "last_modified": row[2], "fetched_at": row[3], "artifacts": json.loads(row[4])}
+        if not all(os.path.exists(self._object_path(digest, ext)) for ext, digest in entry["artifacts"].items()):
+            return None
+        return entry
+
+    def touch(self, key: str, revalidated: bool = False):
+        """Mark an entry used, and fresh again if it was just revalidated"""
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            if revalidated:
+                db.execute("UPDATE pages SET last_access = ?, fetched_at = ? WHERE key = ?", (now, now, key))
+            else:
+                db.execute("UPDATE pages SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+
+    def store(self, key: str, url: str, etag: Optional[str], last_modified: Optional[str], artifacts: dict[str, bytes]) -> dict:
+        """Store an extraction's artifacts, writing only objects that aren't already present"""
+        digests = {}
+        with self._lock:
+            db = self._connect()
+            previous = db.execute("SELECT artifacts FROM pages WHERE key = ?", (key,)).fetchone()
+            for ext, data in artifacts.items():
+                digest = hashlib.sha256(data).hexdigest()
+                digests[ext] = digest
+                path = self._object_path(digest, ext)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    temp_path = path + ".tmp"
+                    with open(temp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(temp_path, path)
+                db.execute("INSERT OR REPLACE INTO objects (digest, ext, size) VALUES (?, ?, ?)", (digest, ext, len(data)))
+            now = time.time()
+            db.execute(
+                "INSERT OR REPLACE INTO pages (key, url, etag, last_modified, fetched_at, last_access, artifacts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, etag, last_modified, now, now, json.dumps(digests)),
+            )
+            if previous is not None:
+                # e.g. the old screenshot of a re-rendered page, which nothing may reference now
+                self._delete_unreferenced(db, json.loads(previous[0]).values())
+            db.commit()
+            self._evict(db, keep=key)
+        return {"url": url, "etag": etag, "last_modified": last_modified, "fetched_at": now, "artifacts": digests}
+
+    def _references(self, db: sqlite3.Connection) -> dict[str, int]:
+        """How many pages reference each object"""
+        referenced: dict[str, int] = {}
+        for (artifacts,) in db.execute("SELECT artifacts FROM pages"):
+            for digest in json.loads(artifacts).values():
+                referenced[digest] = referenced.get(digest, 0) + 1
+        return referenced
+
+    def _delete_object(self, db: sqlite3.Connection, digest: str) -> int:
+        """Delete an object's row and file; returns the bytes freed"""
+        row = db.execute("SELECT ext, size FROM objects WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return 0
+        db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+        with suppress(OSError):
+            os.remove(self._object_path(digest, row[0]))
+        return row[1]
+
+    def _delete_unreferenced(self, db: sqlite3.Connection, digests=None) -> int:
+        """Delete the objects (of digests, or all) that no page references; returns the bytes freed"""
+        referenced = self._references(db)
+        if digests is None:
+            digests = [digest for (digest,) in db.execute("SELECT digest FROM objects").fetchall()]
+        return sum(self._delete_object(db, digest) for digest in set(digests) if digest not in referenced)
+
+    def _evict(self, db: sqlite3.Connection, keep: str):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Objects left behind by earlier versions or interrupted stores go first
+        total -= self._delete_unreferenced(db)
+        referenced = self._references(db)
+        pages = db.execute("SELECT key, artifacts FROM pages ORDER BY last_access").fetchall()
+        for key, artifacts in pages:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            db.execute("DELETE FROM pages WHERE key = ?", (key,))
+            for digest in json.loads(artifacts).values():
+                referenced[digest] -= 1
+                if referenced[digest] == 0:
+                    total -= self._delete_object(db, digest)
+        db.commit()
+
+    def materialize(self, entry: dict, output_dir: str, stem: str) -> dict:
+        """Copy the entry's objects into output_dir; returns their paths"""
+        os.makedirs(output_dir, exist_ok=True)
+        paths = {}
+        for ext, digest in entry["artifacts"].items():
+            source = self._object_path(digest, ext)
+            path = os.path.join(output_dir, f"{stem}.{ext}")
+            # Replace rather than overwrite, in case it's a hard link left by an older version
+            with suppress(FileNotFoundError):
+                os.remove(path)
+            _copy_file(source, path)
+            paths[_ARTIFACT_KEYS[ext]] = path
+        return paths
+
+    def load_clean_data(self, entry: dict) -> dict:
+        with open(self._object_path(entry["artifacts"]["json"], "json"), encoding="utf-8") as f:
+            return json.load(f)
+
+extraction_cache = ExtractionCache(WEB_CACHE_DIR, WEB_CACHE_MAX_BYTES)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared HTTP client for requests that don't need the browser"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+            timeout=WEB_NAV_TIMEOUT,
+        )
+    return _http_client
+
+async def is_unchanged(entry: dict) -> bool:
+    """Ask the server whether a cached page changed, using its ETag/Last-Modified"""
+    headers = {}
+    if entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    if not headers:
+        return False
+    try:
+        async with get_http_client().stream("GET", entry["url"], headers=headers) as response:
+            return response.status_code == 304
+    except httpx.HTTPError:
+        return False
+
+async def render_page(url: str, screenshot: bool = True) -> tuple[str, str, Optional[bytes], dict]:
+    """Render url in a pooled browser context; returns the final URL, HTML, a full-page screenshot (if wanted) and the response headers"""
+    async with browser_pool.page() as page:
+        response = await page.goto(url, wait_until="load", timeout=WEB_NAV_TIMEOUT * 1000)
+        screenshot = await page.screenshot(full_page=True) if screenshot else None
+        return page.url, await page.content(), screenshot, (response.headers if response else {})
+
+class NeedsBrowser(Exception):
+    """The page can't be extracted from its raw HTML"""
+
+async def fetch_and_clean(url: str) -> tuple[str, str, dict, dict]:
+    """
+    Fetch url over the shared HTTP client and clean it while it streams in, without a
+    browser. Returns the final URL, cleaned HTML, clean_data and the response headers.
+    Raises NeedsBrowser when the page looks like it's rendered with JavaScript, isn't
+    HTML, is too large, or the server turned the client away.
+    """
+    try:
+        async with get_http_client().stream("GET", url) as response:
+            if response.status_code in (401, 403, 429) or response.status_code >= 500:
+                raise NeedsBrowser(f"HTTP {response.status_code}")
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            if "html" not in content_type:
+                raise NeedsBrowser(f"Unsupported content type: {content_type}")
+            final_url = str(response.url)
+            headers = {"etag": response.headers.get("etag"), "last-modified": response.headers.get("last-modified")}
+            cleaner = StreamingCleaner(final_url)
+            # Count the (decompressed) bytes and decode them ourselves, as aiter_text() only
+            # yields characters
+            decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+            received = 0
+            async for chunk in response.aiter_bytes():
+                received += len(chunk)
+                if received > WEB_FAST_MAX_BYTES:
+                    raise NeedsBrowser("Page too large for fast mode")
+                cleaner.feed(decoder.decode(chunk))
+            cleaner.feed(decoder.decode(b"", final=True))
+    except httpx.TransportError as e:
+        raise NeedsBrowser(str(e))
+
+    clean_html_text, clean_data = cleaner.result()
+    text_length = sum(len(item["text"]) for item in clean_data["main_content"])
+    if text_length < WEB_FAST_MIN_TEXT or (cleaner.js_required_hint and text_length < 4 * WEB_FAST_MIN_TEXT):
+        raise NeedsBrowser("Page content is rendered with JavaScript")
+    return final_url, clean_html_text, clean_data, headers
+
+# How extract_clean_content saves the files for an extraction
+PERSIST_MODES = ("sync", "background", "none")
+
+# Artifact writes still running in the background; awaited on shutdown
+_background_writes: set[asyncio.Task] = set()
+
+def write_in_background(func, *args):
+    """Run a blocking write in a worker thread without waiting for it"""
+    async def run():
+        try:
+            await asyncio.to_thread(func, *args)
+        except Exception as e:
+            print(f"Background write failed: {e}", file=sys.stderr)
+    task = asyncio.create_task(run())
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+
+def _artifact_paths(output_dir: str, stem: str, exts) -> dict:
+    """The paths the artifacts with these extensions are (or will be) saved at"""
+    return {_ARTIFACT_KEYS[ext]: os.path.join(output_dir, f"{stem}.{ext}") for ext in exts}
+
+async def extract_clean_content(url: str, output_dir: str, fast: bool = False, persist: str = "sync") -> dict:
+    """
+    Render url in a pooled browser context, clean it, and save a screenshot plus the
+    cleaned HTML, JSON and text into output_dir. Returns clean_data, the file paths and
+    the source of the result ("cache", "http" or "browser").
+    Cached extractions are reused without starting the browser while fresh or unchanged.
+    With fast=True the page is fetched over plain HTTP and cleaned without a screenshot,
+    falling back to the browser only when the page needs JavaScript.
+    persist="background" returns before the files are written, and persist="none" saves
+    nothing into output_dir (and takes no screenshot), returning clean_data only.
+    """
+    if persist not in PERSIST_MODES:
+        raise ValueError(f"persist must be one of {', '.join(PERSIST_MODES)}")
+    # Timestamp plus URL hash, so pages extracted in parallel don't overwrite each other
+    stem = f"extracted_clean_page_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{hashlib.sha1(url.encode()).hexdigest()[:8]}"
+    key = normalize_url(url)
+    want_screenshot = not fast and persist != "none"
+
+    if WEB_CACHE_TTL > 0:
+        entry = await asyncio.to_thread(extraction_cache.lookup, key)
+        # Entries without a screenshot only serve requests that don't want one
+        if entry is not None and (not want_screenshot or "png" in entry["artifacts"]):
+            fresh = time.time() - entry["fetched_at"] < WEB_CACHE_TTL
+            if fresh or await is_unchanged(entry):
+                await asyncio.to_thread(extraction_cache.touch, key, not fresh)
+                clean_data = await asyncio.to_thread(extraction_cache.load_clean_data, entry)
+                if persist == "sync":
+                    paths = await asyncio.to_thread(extraction_cache.materialize, entry, output_dir, stem)
+                elif persist == "background":
+                    write_in_background(extraction_cache.materialize, entry, output_dir, stem)
+                    paths = _artifact_paths(output_dir, stem, entry["artifacts"])
+                else:
+                    paths = {}
+                return {"clean_data": clean_data, "source": "cache", **paths}
+
+    try:
+        if not fast:
+            raise NeedsBrowser("Browser rendering requested")
+        final_url, clean_html_text, clean_data, headers = await fetch_and_clean(url)
+        screenshot = None
+        source = "http"
+    except NeedsBrowser:
+        final_url, html, screenshot, headers = await render_page(url, screenshot=want_screenshot)
+        # Parsing is CPU-bound; keep it off the event loop
+        clean_html_text, clean_data = await asyncio.to_thread(clean_html, html, final_url)
+        source = "browser"
+
+    artifacts = build_artifacts(clean_html_text, clean_data, screenshot)
+
+    def save() -> dict:
+        if WEB_CACHE_TTL > 0:
+            entry = extraction_cache.store(key, final_url, headers.get("etag"), headers.get("last-modified"), artifacts)
+            if persist == "none":
+                return {}
+            return extraction_cache.materialize(entry, output_dir, stem)
+        if persist == "none":
+            return {}
+        return _save_artifacts(output_dir, stem, artifacts)
+
+    if persist == "sync":
+        paths = await asyncio.to_thread(save)
+    else:
+        # The cache still gets the extraction, just off the response path
+        write_in_background(save)
+        paths = _artifact_paths(output_dir, stem, artifacts) if persist == "background" else {}
+    return {"clean_data": clean_data, "source": source, **paths}
+
+# Fields of clean_data that extract_webpage_json can select
+CLEAN_DATA_FIELDS = ("title", "url", "main_content", "links")
+
+def select_fields(clean_data: dict, fields: Optional[list[str]] = None, max_items: Optional[int] = None,
+                  max_text_length: Optional[int] = None) -> dict:
+    """
+    Trim clean_data to the requested fields, keeping at most max_items content blocks and
+    links, and cutting the title and each block's or link's text to max_text_length characters.
+    """
+    fields = list(fields) if fields else list(CLEAN_DATA_FIELDS)
+    unknown = [field for field in fields if field not in CLEAN_DATA_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (choose from {', '.join(CLEAN_DATA_FIELDS)})")
+
+    def cut(text: str) -> str:
+        return text if max_text_length is None else text[:max_text_length]
+
+    selected = {}
+    for field in fields:
+        value = clean_data[field]
+        if field in ("main_content", "links"):
+            value = [{**item, "text": cut(item["text"])} for item in value[:max_items]]
+        elif field == "title":
+            value = cut(value)
+        selected[field] = value
+    return selected
+
+# Links to files that aren't web pages, which the crawler doesn't follow
+_NON_PAGE_EXTENSIONS = re.compile(
+    r"\.(?:pdf|zip|gz|tgz|tar|rar|7z|exe|dmg|iso|png|jpe?g|gif|svg|webp|ico|bmp|mp[34]|webm|avi|mov|wav|ogg|css|js|json|xml|woff2?|ttf)$",
+    re.IGNORECASE,
+)
+
+class HostThrottle:
+    """Limits how many pages of one host are fetched at once and how soon requests to it may start"""
+
+    def __init__(self, concurrency: int, delay: float):
+        self.delay = delay
+        self._slots = asyncio.Semaphore(concurrency)
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._slots:
+            async with self._lock:
+                wait = self._next_start - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._next_start = time.monotonic() + self.delay
+            yield
+
+async def fetch_robots(origin: str) -> RobotFileParser:
+    """Fetch and parse origin's robots.txt; a missing one allows everything, as does a server error"""
+    parser = RobotFileParser(origin + "/robots.txt")
+    try:
+        response = await get_http_client().get(origin + "/robots.txt")
+    except httpx.HTTPError:
+        parser.allow_all = True
+        return parser
+    if response.status_code in (401, 403):
+        parser.disallow_all = True
+    elif response.status_code != 200:
+        parser.allow_all = True
+    else:
+        parser.parse(response.text.splitlines())
+    return parser
+
+def _site_host(url: str) -> str:
+    """Host of url for crawl scoping, so example.com and www.example.com count as one site"""
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+class SiteCrawler:
+    """
+    Breadth-first crawl from a start URL over the links in each page's clean_data.
+
+    URLs are deduplicated by their normalized form, kept to the site's host (where the
+    start URL lands after redirects, with or without "www.") and under path_prefix, and
+    filtered through each host's robots.txt. Pages are extracted by up to
+    WEB_CRAWL_CONCURRENCY workers, with at most WEB_CRAWL_PER_HOST at a time per host and
+    requests to a host started at least WEB_CRAWL_DELAY (or its robots.txt Crawl-delay)
+    apart. on_page is awaited with each page's summary as it finishes.
+    """
+
+    def __init__(self, start_url: str, output_dir: str, max_pages: int, max_depth: int, path_prefix: Optional[str],
+                 fast: bool, persist: str, on_page):
+        self.start_url = start_url
+        self.output_dir = output_dir
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.host = _site_host(start_url)
+        self.path_prefix = path_prefix
+        self.fast = fast
+        self.persist = persist
+        self.on_page = on_page
+        self.pages: list[dict] = []
+        self.blocked: list[str] = []
+        self._seen: set[str] = set()
+        self._queued = 0
+        self._frontier: asyncio.Queue = asyncio.Queue()
+        self._robots: dict[str, asyncio.Task] = {}
+        self._throttles: dict[str, HostThrottle] = {}
+
+    def _in_scope(self, url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or _site_host(url) != self.host:
+            return False
+        if self.path_prefix and not (parts.path or "/").startswith(self.path_prefix):
+            return False
+        return not _NON_PAGE_EXTENSIONS.search(parts.path)
+
+    def _enqueue(self, url: str, depth: int):
+        key = normalize_url(url)
+        if key in self._seen or self._queued >= self.max_pages:
+            return
+        self._seen.add(key)
+        self._queued += 1
+        self._frontier.put_nowait((url, depth))
+
+    async def _robots_for(self, url: str) -> RobotFileParser:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        # One fetch per origin, shared by the workers that ask while it's in flight
+        if origin not in self._robots:
+            self._robots[origin] = asyncio.ensure_future(fetch_robots(origin))
+        return await self._robots[origin]
+
+    async def _throttle_for(self, url: str) -> HostThrottle:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in self._throttles:
+            robots = await self._robots_for(url)
+            delay = max(WEB_CRAWL_DELAY, float(robots.crawl_delay(USER_AGENT) or 0))
+            self._throttles.setdefault(origin, HostThrottle(WEB_CRAWL_PER_HOST, delay))
+        return self._throttles[origin]
+
+    async def _visit(self, url: str, depth: int):
+        robots = await self._robots_for(url)
+        if not robots.can_fetch(USER_AGENT, url):
+            self.blocked.append(url)
+            return
+        async with (await self._throttle_for(url)).slot():
+            try:
+                result = await extract_clean_content(url, self.output_dir, self.fast, self.persist)
+            except Exception as e:
+                page = {"url": url, "depth": depth, "error": str(e)}
+                result = None
+        if result is not None:
+            clean_data = result["clean_data"]
+            page = {
+                "url": url,
+                "depth": depth,
+                "title": clean_data["title"],
+                "source": result["source"],
+                "links": len(clean_data["links"]),
+            }
+            if "json_path" in result:
+                page["json_path"] = result["json_path"]
+            if depth == 0:
+                # The start URL may redirect, e.g. example.com to docs.example.com; crawl where it lands
+                self.host = _site_host(clean_data["url"])
+                self._seen.add(normalize_url(clean_data["url"]))
+            if depth < self.max_depth:
+                for link in clean_data["links"]:
+                    if self._in_scope(link["url"]):
+                        self._enqueue(link["url"], depth + 1)
+        self.pages.append(page)
+        await self.on_page(page)
+
+    async def _worker(self):
+        while True:
+            url, depth = await self._frontier.get()
+            try:
+                await self._visit(url, depth)
+            except Exception as e:
+                # A failure outside the extraction itself mustn't take the worker down
+                print(f"Crawl of {url} failed: {e}", file=sys.stderr)
+            finally:
+                self._frontier.task_done()
+
+    async def run(self):
+        self._enqueue(self.start_url, 0)
+        workers = [asyncio.create_task(self._worker()) for _ in range(max(1, WEB_CRAWL_CONCURRENCY))]
+        try:
+            await self._frontier.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
 @mcp.tool()
-async def extract_webpage(url: str, output_dir: Optional[str] = None) -> str:
+async def extract_webpage(url: str, output_dir: Optional[str] = None, fast: bool = False) -> str:
     """
     Extract clean content from a webpage and return a summary of the extraction.
     
     Args:
         url: The URL to extract content from
         output_dir: Directory to save files. Defaults to current directory.
+        fast: Fetch over plain HTTP without a browser or screenshot, using the browser only if the page needs JavaScript.
     
     Returns:
         A summary of the extracted content and paths to saved files.
@@ -33,7 +873,7 @@ async def extract_webpage(url: str, output_dir: Optional[str] = None) -> str:
         output_dir = os.getcwd()
     
     try:
-        result = await extract_clean_content(url, output_dir)
+        result = await extract_clean_content(url, output_dir, fast)
         
         # Format the response
         clean_data = result['clean_data']
@@ -70,13 +910,28 @@ async def extract_webpage(url: str, output_dir: Optional[str] = None) -> str:
         return f"Error extracting content from {url}: {str(e)}"
 
 @mcp.tool()
-async def extract_webpage_json(url: str, output_dir: Optional[str] = None) -> str:
+async def extract_webpage_json(
+    url: str,
+    output_dir: Optional[str] = None,
+    fast: bool = False,
+    persist: str = "sync",
+    fields: Optional[list[str]] = None,
+    max_items: Optional[int] = None,
+    max_text_length: Optional[int] = None,
+    compact: bool = False,
+) -> str:
     """
     Extract clean content from a webpage and return the full extraction results as JSON.
     
     Args:
         url: The URL to extract content from
         output_dir: Directory to save files. Defaults to current directory.
+        fast: Fetch over plain HTTP without a browser or screenshot, using the browser only if the page needs JavaScript.
+        persist: "sync" saves the files before returning, "background" returns while they're written, "none" saves nothing.
+        fields: clean_data fields to return (title, url, main_content, links). Defaults to all.
+        max_items: Most content blocks and links to return.
+        max_text_length: Most characters of the title and of each content block or link text.
+        compact: Return JSON without indentation.
     
     Returns:
         JSON string containing all extracted data.
@@ -88,18 +943,124 @@ async def extract_webpage_json(url: str, output_dir: Optional[str] = None) -> st
         output_dir = os.getcwd()
     
     try:
-        result = await extract_clean_content(url, output_dir)
+        result = await extract_clean_content(url, output_dir, fast, persist)
+        result['clean_data'] = select_fields(result['clean_data'], fields, max_items, max_text_length)
         
         # Convert paths to relative paths for better portability
-        result['screenshot_path'] = os.path.basename(result['screenshot_path'])
-        result['html_path'] = os.path.basename(result['html_path'])
+        if 'screenshot_path' in result:
+            result['screenshot_path'] = os.path.basename(result['screenshot_path'])
+        if 'html_path' in result:
+            result['html_path'] = os.path.basename(result['html_path'])
         
         # Return as formatted JSON string
+        if compact:
+            return json.dumps(result, ensure_ascii=False, separators=(',', ':'))
         return json.dumps(result, indent=2)
     
     except Exception as e:
         return json.dumps({"error": str(e)})
-    
+
+@mcp.tool()
+async def extract_webpages(urls: list[str], output_dir: Optional[str] = None, fast: bool = False) -> str:
+    """
+    Extract clean content from many webpages in parallel.
+
+    Pages are rendered concurrently in the shared browser pool (WEB_POOL_SIZE at a time);
+    a page that fails is reported without failing the others.
+
+    Args:
+        urls: The URLs to extract content from
+        output_dir: Directory to save files. Defaults to current directory.
+        fast: Fetch over plain HTTP without a browser or screenshot, using the browser only if the page needs JavaScript.
+
+    Returns:
+        JSON list with the title and saved file paths, or the error, for each URL.
+    """
+    if output_dir is None:
+        output_dir = os.getcwd()
+
+    async def extract(url: str) -> dict:
+        if not url.startswith(('http://', 'https://')):
+            url = 'https://' + url
+        try:
+            result = await extract_clean_content(url, output_dir, fast)
+        except Exception as e:
+            return {"url": url, "error": str(e)}
+        return {
+            "url": url,
+            "title": result['clean_data']['title'],
+            "html_path": result['html_path'],
+            "json_path": result['json_path'],
+            "text_path": result['text_path'],
+            "screenshot_path": result.get('screenshot_path'),
+            "source": result['source'],
+        }
+
+    results = await asyncio.gather(*(extract(url) for url in urls))
+    return json.dumps(results, indent=2)
+
+@mcp.tool()
+async def crawl_site(
+    start_url: str,
+    ctx: Context,
+    output_dir: Optional[str] = None,
+    max_pages: int = 50,
+    max_depth: int = 3,
+    path_prefix: Optional[str] = None,
+    fast: bool = True,
+    persist: str = "sync",
+) -> str:
+    """
+    Crawl a site from start_url, extracting every page reached by following links on the same host.
+
+    Pages are extracted in parallel, politely per host and within robots.txt. Each page is
+    reported as a progress notification and appended to a .ndjson file in output_dir as soon
+    as it finishes.
+
+    Args:
+        start_url: The URL to start crawling from
+        output_dir: Directory to save files. Defaults to current directory.
+        max_pages: Most pages to extract.
+        max_depth: Most links to follow away from start_url.
+        path_prefix: Only follow links whose path starts with this, e.g. "/docs/".
+        fast: Fetch over plain HTTP without a browser or screenshot, using the browser only if a page needs JavaScript.
+        persist: "sync" saves each page's files, "background" writes them in the background, "none" saves only the .ndjson file.
+
+    Returns:
+        JSON with a summary of each page extracted (or its error) and the URLs robots.txt disallowed.
+    """
+    if not start_url.startswith(('http://', 'https://')):
+        start_url = 'https://' + start_url
+
+    if output_dir is None:
+        output_dir = os.getcwd()
+
+    if persist not in PERSIST_MODES:
+        return json.dumps({"error": f"persist must be one of {', '.join(PERSIST_MODES)}"})
+
+    os.makedirs(output_dir, exist_ok=True)
+    log_path = os.path.join(
+        output_dir,
+        f"crawl_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{hashlib.sha1(start_url.encode()).hexdigest()[:8]}.ndjson",
+    )
+
+    with open(log_path, "a", encoding="utf-8") as log:
+        async def on_page(page: dict):
+            log.write(json.dumps(page, ensure_ascii=False) + "\n")
+            log.flush()
+            await ctx.report_progress(len(crawler.pages), max_pages)
+            await ctx.info(json.dumps(page, ensure_ascii=False))
+
+        crawler = SiteCrawler(start_url, output_dir, max_pages, max_depth, path_prefix, fast, persist, on_page)
+        await crawler.run()
+
+    return json.dumps({
+        "start_url": start_url,
+        "pages": crawler.pages,
+        "disallowed": crawler.blocked,
+        "log_path": log_path,
+    }, indent=2)
+
 # if __name__ == "__main__":
 #     print("Starting webpage extractor MCP server...")
 #     mcp.run(transport='stdio')
@@ -107,4 +1068,4 @@ async def extract_webpage_json(url: str, output_dir: Optional[str] = None) -> st
 if __name__ == "__main__":
     print("Starting webpage extractor MCP server...")
     # Run the ASGI app with Uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=3001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=3001)